@@ -1,151 +1,300 @@
+import os
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
-
-def generate_battery_data(num_rows=500):
-    # Battery capacity ranges (in Ah)
-    capacity_ranges = {
-        "small": (30, 50),
-        "medium": (60, 85),
-        "large": (90, 120)
-    }
-    
-    battery_ids = [f"Battery {i+1}" for i in range(num_rows)]
-    
+
+import instrument
+
+# Battery capacity ranges (in Ah)
+capacity_ranges = {
+    "small": (30, 50),
+    "medium": (60, 85),
+    "large": (90, 120)
+}
+
+# Degradation model shared with the Monte Carlo simulator in simulate.py
+DECAY_RATE_RANGE = (0.01, 0.018)  # SOH % lost per cycle; differs per battery
+SOH_NOISE = 3  # ± % around the degradation curve
+RESISTANCE_BASE_RANGE = (18, 25)  # mΩ when new
+RESISTANCE_GROWTH_RANGE = (0.012, 0.018)  # mΩ gained per cycle
+SOH_RANGE = (60, 100)
+
+
+# Ambient temperature: 70% normal operating temperature, the rest extreme cases.
+# Higher SOC can lead to slightly higher temps during charging.
+def temperature_around(rng, soc_values):
+    base_temp = 25  # room temperature baseline
+    temp = soc_values - 50
+    temp /= 10  # SOC effect
+    temp += base_temp
+    normal = rng.random(len(soc_values)) < 0.7
+    # Ambient effect: -5 to 5 in normal conditions, -10 to 15 otherwise
+    temp += _uniform_between(rng, np.where(normal, -5.0, -10.0), span=np.where(normal, 10.0, 25.0))
+    return np.clip(temp, 10, 45, out=temp)
+
+
+# Higher temperature typically lowers resistance slightly
+def resistance_temperature_factor(temp_values):
+    return 1 - ((temp_values - 25) * 0.005)
+
+
+# Poorer health increases resistance
+def resistance_soh_factor(soh_values):
+    return 1 + ((100 - soh_values) * 0.01)
+
+
+def _uniform_between(rng, low, high=None, span=None):
+    # Per-row uniform draw; cheaper than Generator.uniform with array bounds.
+    # Callers that already know high - low can pass it as `span`.
+    values = rng.random(len(low))
+    values *= high - low if span is None else span
+    values += low
+    return values
+
+
+# Index of the band each uniform draw falls in, given the two cut points;
+# the same as np.searchsorted(cuts, u, side='right') but several times faster
+def _band(u, first, second):
+    return (u >= first).view(np.int8) + (u >= second).view(np.int8)
+
+
+# "Battery <start_id>", "Battery <start_id + 1>", ... written straight into the
+# buffers of one Arrow string array, which pandas stores as is instead of
+# converting a list of Python strings. IDs with the same number of digits are
+# contiguous and give labels of one width, so each such run is filled as a
+# (rows, width) byte matrix, one digit column at a time.
+def _battery_labels(start_id, num_rows):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return [f"Battery {i}" for i in range(start_id, start_id + num_rows)]
+    prefix = np.frombuffer(b"Battery ", dtype=np.uint8)
+    runs = []
+    lo, end = start_id, start_id + num_rows
+    while lo < end:
+        digits = len(str(lo))
+        runs.append((lo, min(end, 10 ** digits), len(prefix) + digits))
+        lo = runs[-1][1]
+
+    offsets = np.zeros(num_rows + 1, dtype=np.int64)
+    data = np.empty(sum((hi - lo) * width for lo, hi, width in runs), dtype=np.uint8)
+    row = pos = 0
+    for lo, hi, width in runs:
+        rows = hi - lo
+        offsets[row + 1:row + rows + 1] = np.arange(pos + width, pos + (rows + 1) * width, width)
+        labels = data[pos:pos + rows * width].reshape(rows, width)
+        labels[:, :len(prefix)] = prefix
+        for k in range(width - len(prefix)):
+            labels[:, -1 - k] = _digit(lo, hi, k)
+        row += rows
+        pos += rows * width
+    array = pa.LargeStringArray.from_buffers(num_rows, pa.py_buffer(offsets), pa.py_buffer(data))
+    return array.to_pandas(types_mapper={pa.large_string(): pd.StringDtype('pyarrow', na_value=np.nan)}.get)
+
+
+# ASCII digit k (counted from the right) of every ID in lo..hi-1. It steps
+# through runs of 10**k equal digits, so it is a repeat of the run values.
+def _digit(lo, hi, k):
+    step = 10 ** k
+    first, last = lo // step, (hi - 1) // step
+    counts = np.full(last - first + 1, step)
+    counts[0] -= lo - first * step
+    counts[-1] -= (last + 1) * step - hi
+    return np.repeat((np.arange(first, last + 1) % 10 + ord('0')).astype(np.uint8), counts)
+
+
+# Float columns in the order they are written, each after the one before it
+FLOAT_COLUMNS = [
+    "State of Charge (SOC) (%)",
+    "State of Health (SOH) (%)",
+    "Initial Rated Capacity (Ah)",
+    "Full Charge Capacity (Ah)",
+    "Voltage (V)",
+    "Temperature (°C)",
+    "Internal Resistance (mΩ)",
+]
+
+
+def _generate_columns(rng, num_rows):
+    # Every column is drawn as a whole array from a numpy Generator, following
+    # the same distributions as the original per-row random.random() model.
+    # The float columns are rounded straight into the rows of one block, which
+    # becomes the DataFrame's float block without being copied again.
+    block = np.empty((len(FLOAT_COLUMNS), num_rows))
+    soc_out, soh_out, initial_out, full_out, voltage_out, temp_out, resistance_out = block
+
     # Generate realistic cycle counts (with some newer and some older batteries)
-    cycle_counts = []
-    for _ in range(num_rows):
-        # 60% will be newer batteries, 40% older
-        if random.random() < 0.6:
-            cycle_counts.append(random.randint(50, 800))
-        else:
-            cycle_counts.append(random.randint(800, 3000))
-    
+    # 60% will be newer batteries, 40% older
+    newer = rng.random(num_rows) < 0.6
+    cycle_counts = np.where(newer, rng.integers(50, 801, num_rows), rng.integers(800, 3001, num_rows))
+
     # Calculate SOH based on cycle count with some randomness
-    soh_values = []
-    for i in range(num_rows):
-        base_soh = 100
-        decay_rate = random.uniform(0.01, 0.018)  # Different batteries degrade at different rates
-        
-        # SOH follows a degradation curve with some randomness
-        theoretical_soh = base_soh - (decay_rate * cycle_counts[i])
-        # Add some random variation (±3%)
-        soh = theoretical_soh + random.uniform(-3, 3)
-        # Ensure SOH isn't too low or too high
-        soh = max(min(soh, 100), 60)
-        soh_values.append(soh)
-    
-    # State of Charge - random but with higher probability of being in normal ranges
-    soc_values = []
-    for _ in range(num_rows):
-        if random.random() < 0.7:
-            # Most batteries are in normal usage range
-            soc_values.append(random.uniform(30, 85))
-        elif random.random() < 0.5:
-            # Some are nearly full
-            soc_values.append(random.uniform(85, 100))
-        else:
-            # Some are getting low
-            soc_values.append(random.uniform(10, 30))
-    
-    # Initial Rated Capacity - allocate different battery sizes
-    initial_capacity_values = []
-    for _ in range(num_rows):
-        r = random.random()
-        if r < 0.3:
-            # Small batteries
-            initial_capacity_values.append(random.uniform(*capacity_ranges["small"]))
-        elif r < 0.7:
-            # Medium batteries (most common)
-            initial_capacity_values.append(random.uniform(*capacity_ranges["medium"]))
-        else:
-            # Large batteries
-            initial_capacity_values.append(random.uniform(*capacity_ranges["large"]))
-    
-    # Calculate Full Charge Capacity based on SOH
-    full_charge_capacity_values = []
-    for i in range(num_rows):
-        # Full charge capacity degrades with SOH
-        full_charge_capacity = initial_capacity_values[i] * (soh_values[i] / 100)
-        full_charge_capacity_values.append(full_charge_capacity)
-    
-    # Voltage ranges based on typical lithium-ion cells
-    voltage_values = []
-    for i in range(num_rows):
-        min_v, max_v = 3.0, 4.2  # Standard lithium-ion voltage range
-        
-        # Voltage is primarily determined by SOC, with some noise
-        base_voltage = min_v + (max_v - min_v) * (soc_values[i] / 100)
-        # Add some small random variation
-        voltage = base_voltage + random.uniform(-0.1, 0.1)
-        voltage_values.append(max(min(voltage, max_v), min_v))
-    
-    # Temperature values - correlate slightly with SOC (higher SOC can lead to slightly higher temps during charging)
-    temp_values = []
-    for i in range(num_rows):
-        base_temp = 25  # room temperature baseline
-        # Higher SOC might indicate recent charging, slightly affecting temperature
-        soc_effect = (soc_values[i] - 50) / 10
-        
-        # Add ambient temperature variation
-        if random.random() < 0.7:
-            # Normal operating temperature
-            ambient_effect = random.uniform(-5, 5)
-        else:
-            # Some extreme cases
-            ambient_effect = random.uniform(-10, 15)
-            
-        temp = base_temp + soc_effect + ambient_effect
-        # Ensure temperature stays within realistic bounds
-        temp = max(min(temp, 45), 10)
-        temp_values.append(temp)
-    
+    base_soh = 100
+    decay_rate = rng.uniform(*DECAY_RATE_RANGE, num_rows)  # Different batteries degrade at different rates
+    # SOH follows a degradation curve with some randomness (±3%)
+    soh_values = base_soh - (decay_rate * cycle_counts) + rng.uniform(-SOH_NOISE, SOH_NOISE, num_rows)
+    # Ensure SOH isn't too low or too high
+    np.clip(soh_values, *SOH_RANGE, out=soh_values)
+    np.round(soh_values, 2, out=soh_out)
+
+    # State of Charge - 70% in the normal usage range, the rest split evenly
+    # between nearly full and getting low
+    # The branch is picked per row first, then one uniform draw is scaled into
+    # that branch's bounds
+    band = _band(rng.random(num_rows), 0.7, 0.85)
+    soc_low = np.array([30.0, 85.0, 10.0])
+    soc_high = np.array([85.0, 100.0, 30.0])
+    soc_values = _uniform_between(rng, soc_low[band], soc_high[band])
+    np.round(soc_values, 2, out=soc_out)
+
+    # Initial Rated Capacity - 30% small, 40% medium (most common), 30% large
+    band = _band(rng.random(num_rows), 0.3, 0.7)
+    cap_low, cap_high = np.array([capacity_ranges[k] for k in ("small", "medium", "large")]).T
+    initial_capacity_values = _uniform_between(rng, cap_low[band], cap_high[band])
+    np.round(initial_capacity_values, 1, out=initial_out)
+
+    # Full charge capacity degrades with SOH
+    initial_capacity_values *= soh_values / 100
+    np.round(initial_capacity_values, 1, out=full_out)
+
+    # Voltage is primarily determined by SOC, with some noise
+    min_v, max_v = 3.0, 4.2  # Standard lithium-ion voltage range
+    voltage_values = min_v + (max_v - min_v) * (soc_values / 100)
+    voltage_values += rng.uniform(-0.1, 0.1, num_rows)
+    np.clip(voltage_values, min_v, max_v, out=voltage_values)
+    np.round(voltage_values, 3, out=voltage_out)
+
+    # Temperature values - correlate slightly with SOC
+    temp_values = temperature_around(rng, soc_values)
+    np.round(temp_values, 1, out=temp_out)
+
     # Internal resistance increases with age (cycle count) and correlates inversely with SOH
-    resistance_values = []
-    for i in range(num_rows):
-        base_resistance = random.uniform(18, 25)  # Base resistance varies by battery
-        growth_rate = random.uniform(0.012, 0.018)  # Different growth rates
-        
-        # Base resistance grows with cycles and is affected by temperature
-        resistance = base_resistance + (growth_rate * cycle_counts[i])
-        
-        # Temperature effect (higher temp typically lowers resistance slightly)
-        temp_factor = 1 - ((temp_values[i] - 25) * 0.005)
-        resistance *= temp_factor
-        
-        # SOH effect (poorer health increases resistance)
-        health_factor = 1 + ((100 - soh_values[i]) * 0.01)
-        resistance *= health_factor
-        
-        # Add some random variation (±10%)
-        resistance *= random.uniform(0.9, 1.1)
-        resistance_values.append(max(resistance, 15))
-    
-    # Create the DataFrame
-    data = {
-        "Battery": battery_ids,
-        "State of Charge (SOC) (%)": [round(soc, 2) for soc in soc_values],
-        "State of Health (SOH) (%)": [round(soh, 2) for soh in soh_values],
-        "Cycle Count": cycle_counts,
-        "Initial Rated Capacity (Ah)": [round(cap, 1) for cap in initial_capacity_values],
-        "Full Charge Capacity (Ah)": [round(cap, 1) for cap in full_charge_capacity_values],
-        "Voltage (V)": [round(v, 3) for v in voltage_values],
-        "Temperature (°C)": [round(t, 1) for t in temp_values],
-        "Internal Resistance (mΩ)": [round(r, 2) for r in resistance_values],
-    }
-    
-    return pd.DataFrame(data)
-
-# Generate a larger dataset with 500 rows
-df = generate_battery_data(500)
-
-# Save to CSV file
-file_path = 'ev_battery_health_data.csv'
-df.to_csv(file_path, index=False)
-
-# Display summary statistics and first few rows
-print(df.describe())
-print("\nFirst 5 rows:")
-print(df.head())
-print(f"\nCSV file saved to {file_path} with {len(df)} rows")
\ No newline at end of file
+    resistance_values = rng.uniform(*RESISTANCE_BASE_RANGE, num_rows)  # Base resistance varies by battery
+    growth_rate = rng.uniform(*RESISTANCE_GROWTH_RANGE, num_rows)  # Different growth rates
+    growth_rate *= cycle_counts
+    resistance_values += growth_rate
+    # Temperature effect
+    resistance_values *= resistance_temperature_factor(temp_values)
+    # SOH effect
+    resistance_values *= resistance_soh_factor(soh_values)
+    # Add some random variation (±10%)
+    resistance_values *= rng.uniform(0.9, 1.1, num_rows)
+    np.maximum(resistance_values, 15, out=resistance_values)
+    np.round(resistance_values, 2, out=resistance_out)
+
+    return block, cycle_counts
+
+
+def generate_battery_data(num_rows=500, seed=None, start_id=1):
+    # seed can be an int, a numpy SeedSequence or an existing Generator
+    with instrument.stage('generate', num_rows):
+        rng = np.random.default_rng(seed)
+        block, cycle_counts = _generate_columns(rng, num_rows)
+
+        # Create the DataFrame
+        return _frame(_battery_labels(start_id, num_rows), block, cycle_counts)
+
+
+# DataFrame whose float columns are the rows of `block`, used as pandas'
+# float block as is
+def _frame(labels, block, cycle_counts):
+    df = pd.DataFrame(block.T, columns=FLOAT_COLUMNS, copy=False)
+    df.insert(0, "Battery", labels)
+    df.insert(3, "Cycle Count", cycle_counts)
+    return df
+
+
+# Yield the dataset as fixed-size DataFrames so only one chunk is ever in memory.
+# One Generator is shared by all chunks and battery IDs continue across them.
+def iter_battery_chunks(num_rows, chunk_size=100_000, seed=None, start_id=1):
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < num_rows:
+        n = min(chunk_size, num_rows - written)
+        yield generate_battery_data(n, seed=rng, start_id=start_id + written)
+        written += n
+
+
+# Stream a generated dataset to disk chunk by chunk. Files ending in .parquet
+# are written as row groups (needs pyarrow), anything else is appended as CSV.
+def write_battery_data(file_path, num_rows, chunk_size=100_000, seed=None, start_id=1):
+    chunks = iter_battery_chunks(num_rows, chunk_size, seed, start_id)
+    if str(file_path).endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in chunks:
+                with instrument.stage('generate:write', len(chunk)):
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(file_path, table.schema)
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for i, chunk in enumerate(chunks):
+                with instrument.stage('generate:write', len(chunk)):
+                    chunk.to_csv(f, index=False, header=(i == 0))
+    return num_rows
+
+
+def shard_path(file_path, index):
+    # DataSets/ev_battery_health_data.csv -> DataSets/ev_battery_health_data-part-00007.csv
+    root, ext = os.path.splitext(str(file_path))
+    return f"{root}-part-{index:05d}{ext}"
+
+
+def _write_shard(args):
+    file_path, num_rows, chunk_size, seed_seq, start_id = args
+    write_battery_data(file_path, num_rows, chunk_size, seed_seq, start_id)
+    return file_path
+
+
+# Split num_rows into fixed-size shards and write each to its own part file in a
+# process pool. Shard boundaries and per-shard seeds (SeedSequence.spawn) depend
+# only on num_rows, shard_rows and seed, so the parts are byte-identical for any
+# number of workers.
+def generate_sharded(file_path, num_rows, shard_rows=1_000_000, chunk_size=100_000, seed=None, workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    num_shards = -(-num_rows // shard_rows)
+    seed_seqs = np.random.SeedSequence(seed).spawn(num_shards)
+    jobs = []
+    for i in range(num_shards):
+        start = i * shard_rows
+        jobs.append((shard_path(file_path, i), min(shard_rows, num_rows - start),
+                     chunk_size, seed_seqs[i], start + 1))
+
+    if workers == 1:
+        return [_write_shard(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_write_shard, jobs))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic EV battery health dataset")
+    parser.add_argument('--rows', type=int, default=500, help="number of batteries to generate")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="rows generated and written per chunk")
+    parser.add_argument('--out', default='ev_battery_health_data.csv', help="output .csv or .parquet file")
+    parser.add_argument('--seed', type=int, default=None, help="seed for reproducible output")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="write sharded part files with this many processes (0 = all cores)")
+    parser.add_argument('--shard-rows', type=int, default=1_000_000, help="rows per part file in sharded mode")
+    args = parser.parse_args(argv)
+
+    if args.workers is None:
+        rows = write_battery_data(args.out, args.rows, args.chunk_size, args.seed)
+        print(f"File saved to {args.out} with {rows} rows")
+    else:
+        parts = generate_sharded(args.out, args.rows, args.shard_rows, args.chunk_size,
+                                 args.seed, args.workers or None)
+        print(f"{len(parts)} part files saved next to {args.out} with {args.rows} rows")
+
+
+if __name__ == '__main__':
+    main()
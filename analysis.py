@@ -1,9 +1,13 @@
 import pandas as pd
 import math
+import queue
+import threading
 
-# Read the CSV file
-file_path = 'DataSets/ev_battery_health_data.csv'
-df = pd.read_csv(file_path)
+import cube
+import instrument
+import metrics
+import sketches
+import storage
 
 # Function to calculate battery efficiency in percentage
 def calculate_efficiency(row):
@@ -148,28 +152,205 @@ def calculate_health_score(row):
     # Round to nearest integer
     return round(health_score)
 
-# Apply these functions to the DataFrame
-df['Efficiency (%)'] = df.apply(calculate_efficiency, axis=1)
-df['Life Span Remaining'] = df.apply(calculate_life_span, axis=1)
-df['Charging/Discharging Rate'] = df.apply(calculate_charging_discharge_rate, axis=1)
+# Row-wise reference implementation, kept to check the vectorized metrics against
+def analyse_rowwise(df):
+    df = df.copy()
+    steps = [
+        ('Efficiency (%)', calculate_efficiency),
+        ('Life Span Remaining', calculate_life_span),
+        ('Charging/Discharging Rate', calculate_charging_discharge_rate),
+        # Apply new parameters
+        ('Temperature Stress Factor', calculate_temperature_stress),
+        ('Voltage Stability Rating', calculate_voltage_stability),
+        # Need to calculate Temperature Stress and Voltage Stability before Health Score
+        ('Battery Health Score', calculate_health_score),
+        ('Capacity Fade (%)', calculate_capacity_fade),
+    ]
+    for column, function in steps:
+        with instrument.stage(f"rowwise:{function.__name__}", len(df)):
+            df[column] = df.apply(function, axis=1)
+    return df
 
-# Apply new parameters
-df['Temperature Stress Factor'] = df.apply(calculate_temperature_stress, axis=1)
-df['Voltage Stability Rating'] = df.apply(calculate_voltage_stability, axis=1)
-# Need to calculate Temperature Stress and Voltage Stability before Health Score
-df['Battery Health Score'] = df.apply(calculate_health_score, axis=1)
-df['Capacity Fade (%)'] = df.apply(calculate_capacity_fade, axis=1)
 
-# Save the updated DataFrame to a new CSV file
-df.to_csv('AnalysedData/battery_health_predictions_updated6.csv', index=False)
+# Add every derived column to the DataFrame using the vectorized metrics engine.
+# Compact frames stay compact: the life span is kept in days (save_dataset
+# formats the text) and the ratings and rate get their COMPACT_SCHEMA types.
+# Their metrics are computed a row group at a time, so the float64 and int64
+# intermediates never span the whole fleet.
+def analyse(df):
+    with instrument.stage('analyse', len(df)):
+        if not storage.is_compact(df):
+            return metrics.compute_metrics(df)
+        targets = [metrics.LIFE_SPAN_DAYS if c == 'Life Span Remaining' else c for c in metrics.ANALYSIS_COLUMNS]
+        targets = [c for c in targets if metrics.available(c, df.columns) and c not in df.columns]
+        step = storage.ROW_GROUP_SIZE
+        parts = [storage.narrow(metrics.compute(df.iloc[start:start + step], targets)[targets])
+                 for start in range(0, max(len(df), 1), step)]
+        # Slices whose rates differ in categories come back as text; narrow makes them categorical again
+        values = storage.narrow(pd.concat(parts))
+        df = df.copy(deep=False)
+        for column in targets:
+            df[column] = values[column]
+        return df
 
 
-print("Analysis complete. The new CSV file 'battery_health_predictions_updated.csv' has been saved.")
+# Compare the vectorized metrics with the row-wise functions, raising on any mismatch
+def check_parity(df):
+    if storage.is_compact(df):
+        df = storage.from_compact(df)
+    expected = analyse_rowwise(df)
+    actual = analyse(df)
+    for column in expected.columns:
+        pd.testing.assert_series_equal(actual[column], expected[column], check_dtype=False)
 
 
-#-----------------------------------------> Output 
+# Parse the CSV on a background thread, keeping at most `read_ahead` chunks
+# queued so parsing overlaps with metric computation and writing. If the
+# consumer stops early (an error while analysing, say), the reader is told to
+# stop and joined instead of being left blocked on a full queue.
+def _read_chunks(file_path, chunk_size, read_ahead=2):
+    chunks = queue.Queue(maxsize=read_ahead)
+    done = object()
+    stop = threading.Event()
 
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
-print(df[["Efficiency (%)", "Charging/Discharging Rate", "Life Span Remaining", 
-         "Temperature Stress Factor", "Voltage Stability Rating", "Battery Health Score",
-         "Capacity Fade (%)"]])
+    def reader():
+        try:
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+                if not put(chunk):
+                    return
+        except BaseException as exc:
+            put(exc)
+            return
+        put(done)
+
+    thread = threading.Thread(target=reader, name='analysis-read-ahead', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Out-of-core analysis: memory is bounded by a few chunks regardless of file size,
+# and the output matches analysing the whole file in one go. An output name
+# ending in .parquet gets one typed row group per chunk. A FleetSketch passed
+# as `sketch` and a FleetCube passed as `cube` are filled chunk by chunk, and
+# parity=True checks every chunk against the row-wise functions.
+def analyse_csv_chunked(input_path, output_path, chunk_size=100_000, sketch=None, cube=None,
+                        parity=False):
+    rows = 0
+    parquet = str(output_path).endswith('.parquet')
+    writer = None
+    out = None if parquet else open(output_path, 'w', newline='', encoding='utf-8')
+    try:
+        for chunk in _read_chunks(input_path, chunk_size):
+            if parity:
+                check_parity(chunk)
+            chunk = analyse(chunk)
+            with instrument.stage('analysis:write', len(chunk)):
+                if parquet:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+
+                    table = pa.Table.from_pandas(storage.to_columnar(chunk), preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table)
+                else:
+                    chunk.to_csv(out, index=False, header=(rows == 0))
+            if sketch is not None:
+                sketch.update(chunk)
+            if cube is not None:
+                cube.update(chunk)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+        if out is not None:
+            out.close()
+    return rows
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Derive battery health metrics from a telemetry CSV")
+    parser.add_argument('--input', default='DataSets/ev_battery_health_data.csv')
+    parser.add_argument('--output', default='AnalysedData/battery_health_predictions_updated6.csv')
+    parser.add_argument('--check-parity', action='store_true',
+                        help="verify the vectorized metrics against the row-wise functions")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="stream the input in chunks of this many rows instead of loading it whole")
+    parser.add_argument('--sketch', action='store_true',
+                        help="also save mergeable distribution sketches next to the output")
+    parser.add_argument('--cube', action='store_true',
+                        help="also save the aggregate cube for drill-downs next to the output")
+    parser.add_argument('--compact', action='store_true',
+                        help="hold the fleet in the compact in-memory layout (integer IDs, float32 sensors)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="parse the input CSV instead of reading its binary sidecar "
+                             "(--chunk-size always parses)")
+    args = parser.parse_args(argv)
+    if args.chunk_size and args.compact:
+        parser.error("--compact cannot be combined with --chunk-size; chunks already bound the memory used")
+    sketch = sketches.FleetSketch() if args.sketch else None
+    fleet_cube = cube.FleetCube() if args.cube else None
+
+    if args.chunk_size:
+        rows = analyse_csv_chunked(args.input, args.output, args.chunk_size, sketch, fleet_cube,
+                                   args.check_parity)
+        if sketch is not None:
+            sketch.save(sketches.sketch_path(args.output))
+        if fleet_cube is not None:
+            fleet_cube.save(cube.cube_path(args.output))
+        print(f"Analysis complete. {rows} rows written to '{args.output}'.")
+        return
+
+    # Read the CSV file
+    with instrument.stage('analysis:read') as stage:
+        df = storage.load_dataset(args.input, compact=args.compact, cache=not args.no_cache)
+        stage.rows = len(df)
+
+    if args.check_parity:
+        check_parity(df)
+        print(f"Vectorized metrics match the row-wise functions on {len(df)} rows of {args.input}")
+
+    df = analyse(df)
+
+    # Save the updated DataFrame as CSV, or as typed Parquet if the name ends in .parquet
+    with instrument.stage('analysis:write', len(df)):
+        storage.save_dataset(df, args.output)
+    if sketch is not None:
+        sketch.update(df).save(sketches.sketch_path(args.output))
+    if fleet_cube is not None:
+        fleet_cube.update(df).save(cube.cube_path(args.output))
+
+    print(f"Analysis complete. The new CSV file '{args.output}' has been saved.")
+
+    #-----------------------------------------> Output
+
+    # Metrics whose inputs the dataset lacks were skipped
+    shown = ["Efficiency (%)", "Charging/Discharging Rate", "Life Span Remaining", metrics.LIFE_SPAN_DAYS,
+             "Temperature Stress Factor", "Voltage Stability Rating", "Battery Health Score",
+             "Capacity Fade (%)"]
+    print(df[[c for c in shown if c in df.columns]])
+
+
+if __name__ == '__main__':
+    main()
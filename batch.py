@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import analysis
+import metrics
+import sketches
+import storage
+
+# Batch analysis of every dataset in a directory or glob, in a process pool.
+#
+# A manifest in the output directory remembers, per input file, the content
+# hash of the input and of the code it was analysed with (metrics, analysis,
+# storage and sketches). Files whose hashes are unchanged (and whose output
+# still exists) are skipped.
+
+MANIFEST_NAME = 'manifest.json'
+
+
+# Modules whose code decides what an output file contains
+OUTPUT_MODULES = (metrics, analysis, storage, sketches)
+
+
+# Hash of the code that produces the outputs; any edit to the metric
+# definitions, the analysis, or how results are written invalidates earlier results
+def metrics_hash():
+    digest = hashlib.sha256()
+    for module in OUTPUT_MODULES:
+        digest.update(f"{module.__name__}:{storage.file_hash(module.__file__)}\n".encode())
+    return digest.hexdigest()
+
+
+def find_inputs(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(glob.glob(pattern))
+
+
+def output_path(input_path, out_dir, fmt='csv'):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(out_dir, f"{stem}-analysed.{fmt}")
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+# Runs in a worker: hash the input, skip it if the manifest entry still matches,
+# otherwise analyse it
+def _analyse_file(job):
+    input_path, out_path, previous, definitions = job
+    digest = storage.file_hash(input_path)
+    if (previous.get('input_hash') == digest and previous.get('metrics_hash') == definitions
+            and os.path.exists(out_path)):
+        return input_path, previous, 'skipped'
+
+    try:
+        df = analysis.analyse(pd.read_csv(input_path))
+        storage.save_dataset(df, out_path)
+        # Per-file sketches can be merged into fleet-wide views without re-reading outputs
+        sketches.FleetSketch().update(df).save(sketches.sketch_path(out_path))
+    except Exception as exc:
+        # One unreadable export must not sink the rest of the nightly batch
+        return input_path, {'error': f"{type(exc).__name__}: {exc}"}, 'failed'
+    entry = {'input_hash': digest, 'metrics_hash': definitions, 'output': out_path, 'rows': len(df)}
+    return input_path, entry, 'analysed'
+
+
+def analyse_batch(pattern, out_dir, workers=None, fmt='csv'):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    definitions = metrics_hash()
+
+    jobs = []
+    for input_path in find_inputs(pattern):
+        key = os.path.abspath(input_path)
+        jobs.append((input_path, output_path(input_path, out_dir, fmt), manifest.get(key, {}), definitions))
+
+    results = {'analysed': [], 'skipped': [], 'failed': []}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for input_path, entry, status in pool.map(_analyse_file, jobs):
+            if status == 'failed':
+                # Drop the entry so the file is retried on the next run
+                manifest.pop(os.path.abspath(input_path), None)
+                results[status].append((input_path, entry['error']))
+            else:
+                manifest[os.path.abspath(input_path)] = entry
+                results[status].append(input_path)
+    save_manifest(out_dir, manifest)
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyse every dataset in a directory or glob")
+    parser.add_argument('inputs', help="directory of CSV files or a glob such as 'DataSets/*.csv'")
+    parser.add_argument('--out-dir', default='AnalysedData/batch')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    args = parser.parse_args(argv)
+
+    results = analyse_batch(args.inputs, args.out_dir, args.workers, args.format)
+    print(f"Analysed {len(results['analysed'])} files, skipped {len(results['skipped'])} unchanged files")
+    for input_path, error in results['failed']:
+        print(f"Failed to analyse {input_path}: {error}")
+
+
+if __name__ == '__main__':
+    main()
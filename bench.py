@@ -0,0 +1,261 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import metrics
+from DataSet import generate_battery_data
+
+# Benchmark suite: how each stage scales with fleet size.
+#
+# Stages are generating the data, each row-wise calculate_* function in
+# analysis.py, its vectorized metric, the whole analysis, and each figure in
+# visualiztion.py. Each (stage, rows) case runs in a fresh process on seeded
+# synthetic data, so peak RSS belongs to that case alone. A case whose process
+# dies (OOM-killed, say) or runs past --timeout is reported as failed instead
+# of stalling the suite. Results (wall and CPU time, peak RSS, rows per
+# second) go to a JSON file. Passing a baseline compares against it and exits
+# non-zero when a case got slower or bigger than the threshold allows.
+# Everything runs offline.
+
+SIZES = [1_000, 100_000, 1_000_000, 10_000_000]
+
+# df.apply runs Python per row; beyond this the row-wise cases would take hours
+ROWWISE_MAX_ROWS = 100_000
+
+# Cases faster than this are too noisy to flag as time regressions
+MIN_SECONDS = 0.05
+
+# Row-wise function -> the metric column it computes
+CALCULATIONS = {
+    'calculate_efficiency': 'Efficiency (%)',
+    'calculate_life_span': 'Life Span Remaining',
+    'calculate_charging_discharge_rate': 'Charging/Discharging Rate',
+    'calculate_capacity_fade': 'Capacity Fade (%)',
+    'calculate_temperature_stress': 'Temperature Stress Factor',
+    'calculate_voltage_stability': 'Voltage Stability Rating',
+    'calculate_health_score': 'Battery Health Score',
+}
+
+
+def _figures():
+    import visualiztion
+    return visualiztion.FIGURES
+
+
+def stage_names():
+    names = ['generate']
+    names += [f"rowwise:{name}" for name in CALCULATIONS]
+    names += [f"metric:{column}" for column in CALCULATIONS.values()]
+    names += ['analyse']
+    names += [f"figure:{name}" for name in _figures()]
+    return names
+
+
+# Build the input of a case (not timed) and return the function to time
+def _prepare(stage, rows, seed, out_dir):
+    if stage == 'generate':
+        return lambda: generate_battery_data(rows, seed=seed)
+
+    df = generate_battery_data(rows, seed=seed)
+    kind, _, name = stage.partition(':')
+    if kind == 'rowwise':
+        function = getattr(analysis, name)
+        # The health score reads the stress and stability columns computed before it
+        df = metrics.compute(df, [c for c in metrics.REGISTRY[CALCULATIONS[name]][0] if c not in df.columns])
+        return lambda: df.apply(function, axis=1)
+    if kind == 'metric':
+        steps = metrics.plan([name], df.columns)
+        # A fresh shallow copy per call so the memoized results are not reused
+        return lambda: steps.execute(df.copy(deep=False))
+    if kind == 'analyse':
+        return lambda: analysis.analyse(df)
+    if kind == 'figure':
+        import visualiztion
+
+        function, columns = _figures()[name]
+        df = metrics.compute(df, columns)[columns]
+        visualiztion._init_worker()
+        return lambda: function(df, out_dir)
+    raise KeyError(f"unknown stage '{stage}'")
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Runs in a fresh process; best of `repeat` runs
+def _run_case(stage, rows, seed, repeat):
+    with tempfile.TemporaryDirectory() as out_dir:
+        run = _prepare(stage, rows, seed, out_dir)
+        setup_rss = _peak_rss_mb()
+        wall, cpu = [], []
+        for _ in range(repeat):
+            started, started_cpu = time.perf_counter(), time.process_time()
+            run()
+            wall.append(time.perf_counter() - started)
+            cpu.append(time.process_time() - started_cpu)
+    return {'stage': stage, 'rows': rows, 'status': 'ok', 'wall_s': min(wall), 'cpu_s': min(cpu),
+            'rows_per_s': rows / min(wall) if min(wall) > 0 else None,
+            'peak_rss_mb': _peak_rss_mb(), 'setup_rss_mb': setup_rss}
+
+
+def _worker(conn, function, args):
+    try:
+        conn.send(('ok', function(*args)))
+    except Exception as exc:
+        conn.send(('error', f"{type(exc).__name__}: {exc}"))
+    conn.close()
+
+
+# Call function(*args) in a fresh spawned process. Raises RuntimeError if it
+# raises, if the process dies without answering (OOM-killed, say) or if it
+# runs past `timeout` seconds, in which case it is killed.
+def _call_in_process(function, args, timeout=None):
+    context = multiprocessing.get_context('spawn')
+    receive, send = context.Pipe(duplex=False)
+    process = context.Process(target=_worker, args=(send, function, args))
+    process.start()
+    send.close()
+    try:
+        # poll also returns once the worker has exited and closed its end
+        if not receive.poll(timeout):
+            raise RuntimeError(f"timed out after {timeout}s")
+        try:
+            status, value = receive.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f"worker died with exit code {process.exitcode}") from None
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receive.close()
+    if status == 'error':
+        raise RuntimeError(value)
+    return value
+
+
+def run_case(stage, rows, seed=0, repeat=1, timeout=None):
+    if stage.startswith('rowwise:') and rows > ROWWISE_MAX_ROWS:
+        return {'stage': stage, 'rows': rows, 'status': 'skipped',
+                'reason': f"row-wise functions are only run up to {ROWWISE_MAX_ROWS} rows"}
+    try:
+        return _call_in_process(_run_case, (stage, rows, seed, repeat), timeout)
+    except RuntimeError as exc:
+        return {'stage': stage, 'rows': rows, 'status': 'failed', 'reason': str(exc)}
+
+
+def environment():
+    import matplotlib
+
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run_suite(stages, sizes, seed=0, repeat=1, report=print, timeout=None):
+    results = []
+    for rows in sizes:
+        for stage in stages:
+            result = run_case(stage, rows, seed, repeat, timeout)
+            results.append(result)
+            report(format_result(result))
+    return {'environment': environment(), 'seed': seed, 'repeat': repeat, 'results': results}
+
+
+def format_result(result):
+    head = f"{result['stage']:<55} {result['rows']:>10,}"
+    if result['status'] != 'ok':
+        return f"{head}  {result['status']}: {result.get('reason', '')}"
+    return (f"{head}  {result['wall_s']:9.3f}s  {result['peak_rss_mb']:8.0f} MB  "
+            f"{result['rows_per_s'] or 0:14,.0f} rows/s")
+
+
+# Cases whose wall time or peak RSS grew by more than `threshold` (0.25 = 25%),
+# plus cases that ran in the baseline and now fail
+def compare(results, baseline, threshold=0.25, min_seconds=MIN_SECONDS):
+    previous = {(r['stage'], r['rows']): r for r in baseline['results'] if r['status'] == 'ok'}
+    regressions = []
+    for result in results['results']:
+        before = previous.get((result['stage'], result['rows']))
+        if before is None:
+            continue
+        if result['status'] == 'failed':
+            # A case that used to run and now raises is the worst regression of all
+            regressions.append({'stage': result['stage'], 'rows': result['rows'], 'metric': 'status',
+                                'baseline': before['status'], 'current': result['status'],
+                                'reason': result.get('reason', '')})
+            continue
+        if result['status'] != 'ok':
+            continue
+        checks = [('peak_rss_mb', before['peak_rss_mb'], result['peak_rss_mb'])]
+        if max(before['wall_s'], result['wall_s']) >= min_seconds:
+            checks.append(('wall_s', before['wall_s'], result['wall_s']))
+        for metric, old, new in checks:
+            if old > 0 and new / old > 1 + threshold:
+                regressions.append({'stage': result['stage'], 'rows': result['rows'], 'metric': metric,
+                                    'baseline': old, 'current': new, 'ratio': new / old})
+    return regressions
+
+
+def _save(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark generation, analysis and rendering across fleet sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', default=None,
+                        help="stages or stage prefixes to run, e.g. generate metric: figure:soc_voltage_hexbin")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument('--output', default='benchmarks/results.json')
+    parser.add_argument('--baseline', default=None, help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown or growth, 0.25 = 25%%")
+    parser.add_argument('--save-baseline', action='store_true', help="also write the results to --baseline")
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="seconds before a case is killed and reported as failed")
+    args = parser.parse_args(argv)
+
+    stages = stage_names()
+    if args.stages:
+        stages = [s for s in stages if any(s == p or s.startswith(p) for p in args.stages)]
+    results = run_suite(stages, args.sizes, args.seed, args.repeat, timeout=args.timeout)
+    _save(args.output, results)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        _save(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            if r['metric'] == 'status':
+                print(f"REGRESSION {r['stage']} at {r['rows']:,} rows: {r['baseline']} -> {r['current']} "
+                      f"({r['reason']})")
+            else:
+                print(f"REGRESSION {r['stage']} at {r['rows']:,} rows: {r['metric']} "
+                      f"{r['baseline']:.3f} -> {r['current']:.3f} ({r['ratio']:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
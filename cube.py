@@ -0,0 +1,324 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import sketches
+import storage
+
+# Materialized aggregate cube of the fleet over the bands the plots group by.
+#
+# Every battery falls into one cell of SOH Range x Temp Range x
+# Charging/Discharging Rate x Health Status. Each cell keeps the number of
+# batteries and, per measure, the count, sum, sum of squares, min, max and a
+# fixed-bin histogram (with underflow and overflow bins) of the values. All
+# cells are filled at once with np.bincount over the flat cell index, so a new
+# chunk of data is folded in with one pass and two cubes merge by addition.
+#
+# Drill-downs select cells along any dimensions and sum them. They never touch
+# the batteries, so their cost depends on the cube size, not the fleet size.
+# to_sketch() turns any slice into a sketches.FleetSketch, so the sketch-backed
+# figures in visualiztion.py can be drawn from the cube. The histogram bins of
+# the sketch columns match FleetSketch's.
+
+DIMENSIONS = {
+    'SOH Range': metrics.SOH_LABELS,
+    'Temp Range': metrics.TEMP_LABELS,
+    'Charging/Discharging Rate': metrics.RATE_LABELS,
+    'Health Status': metrics.HEALTH_LABELS,
+}
+SHAPE = tuple(len(labels) for labels in DIMENSIONS.values())
+CELLS = int(np.prod(SHAPE))
+
+# measure -> (low, high, bins); integer scores get unit bins centred on each value
+MEASURES = {
+    'State of Health (SOH) (%)': (50, 100, 500),
+    'Cycle Count': (0, 3000, 300),
+    'Internal Resistance (mΩ)': (0, 150, 300),
+    'Efficiency (%)': (0, 100, 1000),
+    'Capacity Fade (%)': (-10, 60, 700),
+    'Temperature Stress Factor': (-0.5, 100.5, 101),
+    'Voltage Stability Rating': (-0.5, 10.5, 11),
+    'Battery Health Score': (-0.5, 100.5, 101),
+    'Life Span Years': (-0.5, 15.5, 16),
+}
+STATS = ['count', 'sum', 'sumsq', 'min', 'max']
+
+
+class FleetCube:
+    def __init__(self):
+        # Batteries per cell, and batteries whose bands could not be derived
+        self.rows = np.zeros(CELLS, dtype=np.int64)
+        self.skipped = 0
+        # measure -> (len(STATS), CELLS) statistics and (CELLS, bins + 2) histogram
+        self.stats = {m: _empty_stats() for m in MEASURES}
+        self.histograms = {m: np.zeros((CELLS, bins + 2), dtype=np.int64) for m, (_, _, bins) in MEASURES.items()}
+        # file path -> content hash of every file already folded in
+        self.sources = {}
+
+    # Fold an analysed chunk into the cube; missing band and measure columns are derived
+    def update(self, df):
+        targets = [c for c in list(DIMENSIONS) + list(MEASURES) if metrics.available(c, df.columns)]
+        missing = [d for d in DIMENSIONS if d not in targets]
+        if missing:
+            raise KeyError(f"cannot derive the cube dimensions {missing} from the data")
+        df = metrics.compute(df, targets)
+
+        cell = np.zeros(len(df), dtype=np.int64)
+        valid = np.ones(len(df), dtype=bool)
+        for column, labels in DIMENSIONS.items():
+            codes = _codes(df[column], labels)
+            valid &= codes >= 0
+            cell = cell * len(labels) + codes
+        self.skipped += int((~valid).sum())
+        cell = cell[valid]
+        self.rows += np.bincount(cell, minlength=CELLS)
+
+        for measure, (low, high, bins) in MEASURES.items():
+            if measure not in df.columns:
+                continue
+            values = df[measure].to_numpy(dtype=np.float64)[valid]
+            finite = np.isfinite(values)
+            where, values = cell[finite], values[finite]
+            stats = self.stats[measure]
+            stats[0] += np.bincount(where, minlength=CELLS)
+            stats[1] += np.bincount(where, weights=values, minlength=CELLS)
+            stats[2] += np.bincount(where, weights=values * values, minlength=CELLS)
+            np.minimum.at(stats[3], where, values)
+            np.maximum.at(stats[4], where, values)
+            # Bin 0 is the underflow, bin `bins + 1` the overflow
+            index = np.clip(np.floor((values - low) * (bins / (high - low))), -1, bins).astype(np.int64) + 1
+            self.histograms[measure] += np.bincount(where * (bins + 2) + index,
+                                                    minlength=CELLS * (bins + 2)).reshape(CELLS, bins + 2)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.skipped += other.skipped
+        for measure in MEASURES:
+            self.stats[measure][:3] += other.stats[measure][:3]
+            np.minimum(self.stats[measure][3], other.stats[measure][3], out=self.stats[measure][3])
+            np.maximum(self.stats[measure][4], other.stats[measure][4], out=self.stats[measure][4])
+            self.histograms[measure] += other.histograms[measure]
+        self.sources.update(other.sources)
+        return self
+
+    # Flat cell mask for {dimension: label or list of labels}
+    def mask(self, where=None):
+        selected = np.ones(SHAPE, dtype=bool)
+        for column, wanted in (where or {}).items():
+            if column not in DIMENSIONS:
+                raise KeyError(f"'{column}' is not a cube dimension; use one of {list(DIMENSIONS)}")
+            wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+            unknown = [w for w in wanted if w not in DIMENSIONS[column]]
+            if unknown:
+                raise ValueError(f"unknown {column} {unknown}; expected one of {DIMENSIONS[column]}")
+            keep = np.isin(DIMENSIONS[column], wanted)
+            axis = list(DIMENSIONS).index(column)
+            selected &= keep.reshape([-1 if a == axis else 1 for a in range(len(SHAPE))])
+        return selected.ravel()
+
+    # Batteries and count/mean/std/min/max per measure for the selected cells,
+    # one row per combination of the `by` dimensions
+    def summary(self, by=(), where=None, measures=None):
+        by = list(by)
+        unknown = [d for d in by if d not in DIMENSIONS]
+        if unknown:
+            raise KeyError(f"{unknown} are not cube dimensions; use any of {list(DIMENSIONS)}")
+        axes = tuple(a for a, d in enumerate(DIMENSIONS) if d not in by)
+        kept = [d for d in DIMENSIONS if d in by]
+        order = [kept.index(d) for d in by]
+        selected = self.mask(where)
+
+        def reduce(values, combine=np.sum, empty=0):
+            values = np.where(selected, values, empty).reshape(SHAPE)
+            return combine(values, axis=axes).transpose(order).ravel()
+
+        columns = {'Batteries': reduce(self.rows)}
+        for measure in measures or MEASURES:
+            count, total, sumsq, low, high = self.stats[measure]
+            n = reduce(count)
+            s = reduce(total)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = s / n
+                variance = (reduce(sumsq) - s * mean) / (n - 1)
+            columns[f"{measure} count"] = n
+            columns[f"{measure} mean"] = mean
+            columns[f"{measure} std"] = np.sqrt(np.maximum(variance, 0))
+            columns[f"{measure} min"] = np.where(n > 0, reduce(low, np.min, np.inf), np.nan)
+            columns[f"{measure} max"] = np.where(n > 0, reduce(high, np.max, -np.inf), np.nan)
+        index = pd.MultiIndex.from_product([DIMENSIONS[d] for d in by], names=by) if by else None
+        return pd.DataFrame(columns, index=index)
+
+    def histogram(self, measure, where=None):
+        low, high, bins = MEASURES[measure]
+        counts = self.histograms[measure][self.mask(where)].sum(axis=0)
+        return sketches.Histogram(low, high, bins, counts[1:-1], int(counts[0]), int(counts[-1]))
+
+    def moments(self, measure, where=None):
+        count, total, sumsq, low, high = self.stats[measure][:, self.mask(where)]
+        n = int(count.sum())
+        if n == 0:
+            return sketches.Moments()
+        mean = total.sum() / n
+        return sketches.Moments(n, mean, max(sumsq.sum() - total.sum() * mean, 0.0), low.min(), high.max())
+
+    # t-digest of an integer-valued measure. Unit bins centred on each value make
+    # the bin centres exact; every bin enters as many equal pieces so the digest
+    # splits long runs of one value into clusters as it does for raw values.
+    def digest(self, measure, where=None, compression=200):
+        histogram = self.histogram(measure, where)
+        centres = (histogram.edges[:-1] + histogram.edges[1:]) / 2
+        occupied = histogram.counts > 0
+        pieces = sketches.TDigest(compression, np.repeat(centres[occupied], compression),
+                                  np.repeat(histogram.counts[occupied] / compression, compression))
+        return sketches.TDigest(compression).merge(pieces)
+
+    # The FleetSketch of the selected batteries, for the sketch-backed figures
+    def to_sketch(self, where=None):
+        where = dict(where or {})
+        sketch = sketches.FleetSketch()
+        sketch.capacity_fade = self.histogram('Capacity Fade (%)', where)
+        sketch.capacity_fade_moments = self.moments('Capacity Fade (%)', where)
+        for label in metrics.TEMP_LABELS:
+            if _selects(where, 'Temp Range', label):
+                part = dict(where, **{'Temp Range': label})
+                sketch.efficiency[label] = self.histogram('Efficiency (%)', part)
+                sketch.efficiency_moments[label] = self.moments('Efficiency (%)', part)
+        for label in metrics.SOH_LABELS:
+            if _selects(where, 'SOH Range', label):
+                part = dict(where, **{'SOH Range': label})
+                sketch.temperature_stress[label] = self.digest('Temperature Stress Factor', part)
+                sketch.temperature_stress_moments[label] = self.moments('Temperature Stress Factor', part)
+        return sketch
+
+    def save(self, file_path):
+        arrays = {'rows': self.rows}
+        for i, measure in enumerate(MEASURES):
+            arrays[f"stats{i}"] = self.stats[measure]
+            arrays[f"histogram{i}"] = self.histograms[measure]
+        meta = {'dimensions': DIMENSIONS, 'measures': MEASURES, 'skipped': self.skipped, 'sources': self.sources}
+        with open(file_path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(file_path + '.tmp', file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['dimensions'] != DIMENSIONS or meta['measures'] != {m: list(b) for m, b in MEASURES.items()}:
+                raise ValueError(f"'{file_path}' was built with other dimensions or bins; rebuild it")
+            cube = cls()
+            cube.rows = data['rows']
+            for i, measure in enumerate(MEASURES):
+                cube.stats[measure] = data[f"stats{i}"]
+                cube.histograms[measure] = data[f"histogram{i}"]
+        cube.skipped = meta['skipped']
+        cube.sources = meta['sources']
+        return cube
+
+
+def _empty_stats():
+    stats = np.zeros((len(STATS), CELLS))
+    stats[3] = np.inf
+    stats[4] = -np.inf
+    return stats
+
+
+# Position of each value among `labels`; -1 for missing values and labels the cube does not know
+def _codes(values, labels):
+    labels = pd.Index(labels)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Look up each category once; code -1 (missing) picks the trailing -1
+        lookup = np.append(labels.get_indexer(values.cat.categories), -1)
+        return lookup[values.cat.codes.to_numpy()].astype(np.int64)
+    return labels.get_indexer(values).astype(np.int64)
+
+
+def _selects(where, column, label):
+    wanted = where.get(column)
+    return wanted is None or label == wanted or (not isinstance(wanted, str) and label in wanted)
+
+
+# Cubes are persisted next to the analysed output they describe
+def cube_path(output_path):
+    root, _ = os.path.splitext(str(output_path))
+    return f"{root}.cube.npz"
+
+
+# Fold a CSV or Parquet dataset into `cube` chunk by chunk, skipping files
+# whose content has already been absorbed
+def add_file(cube, file_path, chunk_size=1_000_000):
+    digest = storage.file_hash(file_path)
+    key = os.path.abspath(file_path)
+    if cube.sources.get(key) == digest:
+        return False
+    if key in cube.sources:
+        raise ValueError(f"'{file_path}' changed since it was added; rebuild the cube to replace its data")
+
+    if str(file_path).endswith('.parquet'):
+        cube.update(storage.load_dataset(file_path))
+    else:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            cube.update(storage.to_columnar(chunk))
+    cube.sources[key] = digest
+    return True
+
+
+# "Temp Range=20-40°C" or "Health Status=Poor|Critical"
+def parse_where(items):
+    where = {}
+    for item in items:
+        column, _, value = item.partition('=')
+        if not value:
+            raise ValueError(f"cannot parse '{item}'; expected 'dimension=label' or 'dimension=label|label'")
+        where[column.strip()] = value.strip().split('|')
+    return where
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, update and drill into the fleet aggregate cube")
+    parser.add_argument('--input', nargs='*', default=[], help="datasets to fold into the cube")
+    parser.add_argument('--cube', default='AnalysedData/fleet.cube.npz',
+                        help="cube file; new inputs are added to it if it exists")
+    parser.add_argument('--rebuild', action='store_true', help="start from an empty cube")
+    parser.add_argument('--by', nargs='*', default=[], help="dimensions to break the summary down by")
+    parser.add_argument('--where', action='append', default=[],
+                        help="'dimension=label' or 'dimension=label|label' (repeat to AND)")
+    parser.add_argument('--measures', nargs='+', default=['Battery Health Score'], choices=list(MEASURES))
+    parser.add_argument('--allow-skipped', action='store_true',
+                        help="add inputs even if some rows have band labels the cube does not know")
+    args = parser.parse_args(argv)
+
+    cube = FleetCube()
+    if os.path.exists(args.cube) and not args.rebuild:
+        cube = FleetCube.load(args.cube)
+    added = []
+    for path in args.input:
+        before = (int(cube.rows.sum()), cube.skipped)
+        if not add_file(cube, path):
+            continue
+        rows, skipped = int(cube.rows.sum()) - before[0], cube.skipped - before[1]
+        added.append(path)
+        print(f"{path}: {rows} batteries added, {skipped} skipped")
+        if skipped and not args.allow_skipped:
+            # Nothing has been saved yet, so the cube file is left as it was
+            parser.error(f"{skipped} rows of '{path}' fall outside the cube's bands or have labels it "
+                         f"does not know; pass --allow-skipped to add the rest anyway")
+    if added or not os.path.exists(args.cube):
+        os.makedirs(os.path.dirname(args.cube) or '.', exist_ok=True)
+        cube.save(args.cube)
+    print(f"Added {len(added)} new file(s) to {args.cube} ({int(cube.rows.sum())} batteries, "
+          f"{cube.skipped} skipped)")
+
+    summary = cube.summary(args.by, parse_where(args.where), args.measures)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_rows', 500):
+        print(summary[summary['Batteries'] > 0].round(2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import numpy as np
+
+# Binned Gaussian kernel density estimates for large fleets.
+#
+# Samples are linearly binned onto a regular grid and the bin counts are
+# convolved with the sampled Gaussian kernel through an FFT, so the cost is
+# O(n + G log G) instead of the O(n * G) of an exact KDE. Bandwidths follow
+# Scott's rule like seaborn's kdeplot (bw = std * n ** (-1/5)), and the grid
+# extends `cut` bandwidths past the data like seaborn does.
+#
+# With the default 1024-point grid the result stays within 1e-3 of the exact
+# KDE, relative to the peak density, for all the distributions plotted here.
+
+GRID_SIZE = 1024
+
+
+def scott_bandwidth(values):
+    if len(values) < 2:
+        return 1.0
+    return scott_bandwidth_from_moments(len(values), np.std(values, ddof=1))
+
+
+def scott_bandwidth_from_moments(n, std):
+    if n < 2:
+        return 1.0
+    return (std if std > 0 else 1.0) * n ** (-1 / 5)
+
+
+# Spread each sample's unit weight over its two neighbouring grid points
+def _linear_bin(values, codes, n_groups, low, dx, size):
+    position = (values - low) / dx
+    left = np.clip(np.floor(position).astype(np.int64), 0, size - 2)
+    right_weight = np.clip(position - left, 0, 1)
+    offset = codes * size + left
+    counts = np.bincount(offset, weights=1 - right_weight, minlength=n_groups * size)
+    counts += np.bincount(offset + 1, weights=right_weight, minlength=n_groups * size)
+    return counts.reshape(n_groups, size)
+
+
+# Density of each group on a shared grid. `codes` are integer group ids in
+# [0, n_groups); pass None for a single group. Returns (grid, densities) with
+# densities shaped (n_groups, gridsize), each integrating to 1.
+def grouped_kde(values, codes=None, n_groups=None, gridsize=GRID_SIZE, cut=3, bandwidths=None):
+    values = np.asarray(values, dtype=np.float64)
+    if codes is None:
+        codes = np.zeros(len(values), dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    keep = np.isfinite(values) & (codes >= 0)
+    values, codes = values[keep], codes[keep]
+    if n_groups is None:
+        n_groups = int(codes.max()) + 1 if len(codes) else 1
+
+    sizes = np.bincount(codes, minlength=n_groups)
+    if bandwidths is None:
+        bandwidths = np.array([scott_bandwidth(values[codes == g]) for g in range(n_groups)])
+    bandwidths = np.asarray(bandwidths, dtype=np.float64)
+
+    if len(values) == 0:
+        return np.linspace(0, 1, gridsize), np.zeros((n_groups, gridsize))
+    low = values.min() - cut * bandwidths.max()
+    high = values.max() + cut * bandwidths.max()
+    grid = np.linspace(low, high, gridsize)
+    dx = grid[1] - grid[0]
+
+    counts = _linear_bin(values, codes, n_groups, low, dx, gridsize)
+
+    # Kernel sampled at every grid offset, wrapped so the circular FFT
+    # convolution acts as a linear one on the zero-padded signal
+    padded = 2 * gridsize
+    lags = np.arange(padded)
+    lags = np.where(lags < gridsize, lags, lags - padded) * dx
+    kernels = np.exp(-0.5 * (lags[None, :] / bandwidths[:, None]) ** 2)
+    kernels /= np.sqrt(2 * np.pi) * bandwidths[:, None]
+
+    smoothed = np.fft.irfft(np.fft.rfft(counts, padded, axis=1) * np.fft.rfft(kernels, axis=1),
+                            padded, axis=1)[:, :gridsize]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        densities = np.maximum(smoothed, 0) / sizes[:, None]
+    densities[sizes == 0] = 0
+    return grid, densities
+
+
+def kde(values, gridsize=GRID_SIZE, cut=3, bandwidth=None):
+    grid, densities = grouped_kde(values, gridsize=gridsize, cut=cut,
+                                  bandwidths=None if bandwidth is None else [bandwidth])
+    return grid, densities[0]
+
+
+# Exact Gaussian KDE, O(n * G); only meant for checking the binned estimate on small samples
+def exact_kde(values, grid, bandwidth):
+    values = np.asarray(values, dtype=np.float64)
+    z = (grid[:, None] - values[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+
+
+# KDE from an already binned histogram (equal-width bins), e.g. a persisted
+# sketch. The bin centres act as the grid, so no raw samples are needed.
+def kde_from_counts(edges, counts, bandwidth):
+    counts = np.asarray(counts, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64)
+    size = len(counts)
+    dx = edges[1] - edges[0]
+    grid = (edges[:-1] + edges[1:]) / 2
+
+    padded = 2 * size
+    lags = np.arange(padded)
+    lags = np.where(lags < size, lags, lags - padded) * dx
+    kernel = np.exp(-0.5 * (lags / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth)
+    smoothed = np.fft.irfft(np.fft.rfft(counts, padded) * np.fft.rfft(kernel), padded)[:size]
+    total = counts.sum()
+    return grid, np.maximum(smoothed, 0) / (total if total else 1)
@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+
+import analysis
+import storage
+
+# Row-level incremental analysis keyed by the Battery column.
+#
+# Next to the analysed output we keep a fingerprint per battery: a 64-bit hash
+# of its input columns. On the next run only batteries that are new or whose
+# fingerprint changed have their metrics recomputed; everything else is copied
+# from the previous output, and batteries missing from the new export are dropped.
+
+
+def fingerprint_path(output_path):
+    root, ext = os.path.splitext(str(output_path))
+    return f"{root}.fingerprints{ext}"
+
+
+# One 64-bit hash per row, computed from the raw input columns only. Stored as
+# int64 so it survives a CSV round trip unchanged.
+def fingerprint(df):
+    inputs = [c for c in df.columns if c in storage.RAW_SCHEMA and c != 'Battery']
+    return pd.util.hash_pandas_object(df[inputs], index=False).to_numpy().view('int64')
+
+
+def _check_keys(df):
+    if 'Battery' not in df.columns:
+        raise ValueError("incremental analysis needs a 'Battery' column to key rows on")
+    if df['Battery'].duplicated().any():
+        raise ValueError("incremental analysis needs unique values in the 'Battery' column")
+
+
+def _load_previous(output_path):
+    fp_path = fingerprint_path(output_path)
+    if not (os.path.exists(output_path) and os.path.exists(fp_path)):
+        return None, None
+    previous = storage.load_dataset(output_path).set_index('Battery')
+    fingerprints = storage.load_dataset(fp_path).set_index('Battery')['Fingerprint']
+    return previous, fingerprints
+
+
+# Analyse `df` into `output_path`, reusing unchanged rows of the previous output.
+# Returns counts of recomputed, reused and dropped rows.
+def analyse_incremental(df, output_path):
+    _check_keys(df)
+    new_fingerprints = pd.Series(fingerprint(df), index=df['Battery'].to_numpy())
+
+    previous, old_fingerprints = _load_previous(output_path)
+    if previous is None:
+        changed = pd.Series(True, index=new_fingerprints.index)
+        dropped = 0
+    else:
+        changed = old_fingerprints.reindex(new_fingerprints.index) != new_fingerprints
+        dropped = int((~old_fingerprints.index.isin(new_fingerprints.index)).sum())
+
+    recomputed = storage.to_columnar(analysis.analyse(df[changed.to_numpy()])).set_index('Battery')
+    if previous is None:
+        result = recomputed
+    else:
+        reused = previous.loc[changed.index[~changed.to_numpy()]]
+        result = pd.concat([reused, recomputed]).reindex(new_fingerprints.index)
+        # Categories of the two halves may differ, so re-apply the schema after merging
+        result = result.astype({c: t for c, t in storage.ANALYSED_SCHEMA.items() if c in result.columns})
+
+    result.index.name = 'Battery'
+    storage.save_dataset(result.reset_index(), output_path)
+    fingerprints = pd.DataFrame({'Battery': new_fingerprints.index, 'Fingerprint': new_fingerprints.to_numpy()})
+    storage.save_dataset(fingerprints, fingerprint_path(output_path))
+
+    n_changed = int(changed.sum())
+    return {'recomputed': n_changed, 'reused': len(df) - n_changed, 'dropped': dropped}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-analyse only new or changed batteries")
+    parser.add_argument('--input', default='DataSets/ev_battery_health_data.csv')
+    parser.add_argument('--output', default='AnalysedData/battery_health_predictions_updated6.csv')
+    args = parser.parse_args(argv)
+
+    report = analyse_incremental(pd.read_csv(args.input), args.output)
+    print(f"Recomputed {report['recomputed']} rows, reused {report['reused']}, dropped {report['dropped']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+import asyncio
+import collections
+import csv
+import io
+import json
+import os
+import stat
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Live ingestion service: scores batteries seconds after a reading arrives
+# instead of in a nightly analysis.py run.
+#
+# Readings arrive over a local TCP socket (or stdin), one per line, as JSON
+# objects or CSV rows. A CSV stream may start with its own header line;
+# otherwise the columns are taken in the order DataSet.py writes them. Lines
+# go into a bounded queue. When the queue is full the reader stops reading,
+# so TCP flow control pushes back on the sender instead of the service
+# buffering without limit. A single scorer task drains the queue in micro
+# batches and runs the vectorized metrics on each batch. It then keeps the
+# latest reading and scores of every battery in memory.
+#
+# A second port answers queries, one per line:
+#   Battery 42   current state of that battery as JSON
+#   worst 10     the 10 batteries with the lowest health score
+#   stats        counters and p50/p99 ingest-to-score latency
+
+SCORE_COLUMNS = ['Temperature Stress Factor', 'Voltage Stability Rating', 'Battery Health Score']
+
+# Columns a reading must carry for the scores to be computed
+INPUT_COLUMNS = ['Battery', 'State of Charge (SOC) (%)', 'State of Health (SOH) (%)', 'Cycle Count',
+                 'Voltage (V)', 'Temperature (°C)', 'Internal Resistance (mΩ)']
+
+# The scores and every intermediate metric they are derived through. Values a
+# client sends for these are dropped, so every reading is rescored.
+DERIVED_COLUMNS = metrics.plan(SCORE_COLUMNS, INPUT_COLUMNS).steps
+
+# Column order of DataSet.py's CSV output, used for CSV streams without a header
+CSV_COLUMNS = ['Battery', 'State of Charge (SOC) (%)', 'State of Health (SOH) (%)', 'Cycle Count',
+               'Initial Rated Capacity (Ah)', 'Full Charge Capacity (Ah)', 'Voltage (V)', 'Temperature (°C)', 'Internal Resistance (mΩ)']
+
+# Batch size, linger time and queue bound are the latency/throughput knobs
+BATCH_SIZE = 5000
+LINGER = 0.005
+MAX_PENDING = 50_000
+LATENCY_WINDOW = 100_000
+
+
+# Vectorized scores for a batch of readings, dropping rows that are missing a required value
+def score(df):
+    missing = [c for c in INPUT_COLUMNS if c not in df.columns]
+    if missing:
+        return df.iloc[:0], len(df)
+    numeric = {c: pd.to_numeric(df[c], errors='coerce') for c in INPUT_COLUMNS[1:]}
+    df = df.drop(columns=[c for c in DERIVED_COLUMNS if c in df.columns]).assign(**numeric)
+    valid = df[INPUT_COLUMNS].notna().all(axis=1)
+    df = df[valid]
+    return metrics.compute(df, SCORE_COLUMNS), int((~valid).sum())
+
+
+# Parse a micro batch of raw lines into a DataFrame indexed by line position.
+# `header` is None for JSON lines, or the CSV column names for those lines.
+def parse_lines(lines, header):
+    if header is None:
+        records, positions = [], []
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+                positions.append(i)
+        return pd.DataFrame.from_records(records, index=positions), len(lines) - len(records)
+    try:
+        df = pd.read_csv(io.StringIO('\n'.join(lines)), header=None, names=list(header),
+                         on_bad_lines='skip')
+    except (ValueError, pd.errors.ParserError):
+        return pd.DataFrame(), len(lines)
+    return df, len(lines) - len(df)
+
+
+class IngestService:
+    def __init__(self, batch_size=BATCH_SIZE, linger=LINGER, max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        # Battery -> latest reading and scores
+        self.state = {}
+        self.counters = {'received': 0, 'scored': 0, 'rejected': 0, 'batches': 0, 'backpressure_waits': 0}
+        self._latency = np.zeros(LATENCY_WINDOW)
+        self._latency_count = 0
+
+    # Read lines from one stream into the queue until EOF
+    async def feed(self, reader):
+        header = None
+        first = True
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            arrived = time.perf_counter()
+            line = line.decode('utf-8').strip()
+            if not line:
+                continue
+            if first:
+                first = False
+                if not line.startswith('{'):
+                    # CSV stream: use its header line if it has one
+                    columns = next(csv.reader([line]))
+                    if 'Battery' in columns:
+                        header = tuple(columns)
+                        continue
+                    header = tuple(CSV_COLUMNS)
+            self.counters['received'] += 1
+            if self.queue.full():
+                self.counters['backpressure_waits'] += 1
+            await self.queue.put((arrived, header, line))
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        for attempt in range(2):
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # Linger once so a burst that is still arriving lands in the same batch
+            if attempt == 0 and len(batch) < self.batch_size and self.linger:
+                await asyncio.sleep(self.linger)
+        return batch
+
+    # Score micro batches forever
+    async def run_scorer(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                self.score_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def score_batch(self, batch):
+        groups = {}
+        for arrived, header, line in batch:
+            group = groups.setdefault(header, ([], []))
+            group[0].append(arrived)
+            group[1].append(line)
+
+        for header, (arrivals, lines) in groups.items():
+            df, rejected = parse_lines(lines, header)
+            if len(df):
+                df['_arrived'] = np.asarray(arrivals)[df.index]
+                df, invalid = score(df)
+                rejected += invalid
+            self.counters['rejected'] += rejected
+            if len(df) == 0:
+                continue
+
+            latest = df.drop_duplicates('Battery', keep='last')
+            records = latest.drop(columns='_arrived').to_dict('records')
+            self.state.update(zip(latest['Battery'].astype(str), records))
+            self._record_latency(time.perf_counter() - df['_arrived'].to_numpy())
+            self.counters['scored'] += len(df)
+        self.counters['batches'] += 1
+
+    def _record_latency(self, seconds):
+        seconds = seconds[-LATENCY_WINDOW:]
+        positions = (self._latency_count + np.arange(len(seconds))) % LATENCY_WINDOW
+        self._latency[positions] = seconds
+        self._latency_count += len(seconds)
+
+    def stats(self):
+        stats = dict(self.counters, pending=self.queue.qsize(), batteries=len(self.state))
+        window = self._latency[:min(self._latency_count, LATENCY_WINDOW)]
+        if len(window):
+            p50, p99 = np.percentile(window, [50, 99]) * 1000
+            stats.update(latency_p50_ms=round(float(p50), 3), latency_p99_ms=round(float(p99), 3))
+        return stats
+
+    def query(self, request):
+        request = request.strip()
+        if request == 'stats':
+            return self.stats()
+        if request.startswith('worst'):
+            parts = request.split()
+            n = int(parts[1]) if len(parts) > 1 else 10
+            scores = sorted(self.state.items(), key=lambda item: item[1]['Battery Health Score'])
+            return [{'Battery': battery, 'Battery Health Score': state['Battery Health Score']}
+                    for battery, state in scores[:n]]
+        if request in self.state:
+            return self.state[request]
+        return {'error': f"unknown battery '{request}'"}
+
+    async def handle_ingest(self, reader, writer):
+        try:
+            await self.feed(reader)
+        finally:
+            writer.close()
+
+    async def handle_query(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = self.query(line.decode('utf-8'))
+                writer.write(json.dumps(response, default=_json_default).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Line reader over a regular file. Pipe transports refuse regular files
+# (`serve --stdin < readings.csv`), so lines are read in blocks on a worker
+# thread. The next block is only read once the last one is used up, so the
+# queue still pushes back on the reader.
+class _FileLineReader:
+    def __init__(self, stream, block=1 << 16):
+        self._stream = stream
+        self._block = block
+        self._lines = collections.deque()
+        self._eof = False
+
+    async def readline(self):
+        if not self._lines and not self._eof:
+            lines = await asyncio.get_running_loop().run_in_executor(None, self._stream.readlines, self._block)
+            self._lines.extend(lines)
+            self._eof = not lines
+        return self._lines.popleft() if self._lines else b''
+
+
+async def _stdin_reader(stdin=None):
+    stdin = sys.stdin if stdin is None else stdin
+    if stat.S_ISREG(os.fstat(stdin.fileno()).st_mode):
+        return _FileLineReader(stdin.buffer)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=1 << 20)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+    return reader
+
+
+# Run the service. With use_stdin it ingests stdin until EOF, waits for the
+# queue to drain and returns the final stats; otherwise it serves until cancelled.
+async def serve(host='127.0.0.1', port=8765, query_port=8766, use_stdin=False,
+                batch_size=BATCH_SIZE, linger=LINGER, max_pending=MAX_PENDING):
+    service = IngestService(batch_size, linger, max_pending)
+    scorer = asyncio.create_task(service.run_scorer())
+    servers = [await asyncio.start_server(service.handle_query, host, query_port)]
+    try:
+        if use_stdin:
+            await service.feed(await _stdin_reader())
+            await service.queue.join()
+            return service.stats()
+        servers.append(await asyncio.start_server(service.handle_ingest, host, port))
+        print(f"Ingesting on {host}:{port}, queries on {host}:{query_port}")
+        await asyncio.Event().wait()
+    finally:
+        scorer.cancel()
+        for server in servers:
+            server.close()
+
+
+# Query a running service, e.g. query('stats') or query('Battery 42')
+async def query(request, host='127.0.0.1', query_port=8766):
+    reader, writer = await asyncio.open_connection(host, query_port)
+    writer.write(request.encode('utf-8') + b'\n')
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    writer.close()
+    return response
+
+
+# Local load generator: send `rows` generated readings as JSON lines or CSV,
+# optionally paced to `rate` readings per second. drain() blocks whenever the
+# service applies backpressure.
+async def generate_load(rows, host='127.0.0.1', port=8765, fmt='json', rate=None, seed=None, block=1000):
+    from DataSet import generate_battery_data
+
+    df = generate_battery_data(rows, seed=seed)
+    if fmt == 'json':
+        payload = df.to_json(orient='records', lines=True, force_ascii=False)
+    else:
+        payload = df.to_csv(index=False)
+    lines = payload.splitlines(keepends=True)
+
+    reader, writer = await asyncio.open_connection(host, port)
+    started = time.perf_counter()
+    for i in range(0, len(lines), block):
+        writer.write(''.join(lines[i:i + block]).encode('utf-8'))
+        await writer.drain()
+        if rate:
+            ahead = (i + block) / rate - (time.perf_counter() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+    writer.close()
+    await writer.wait_closed()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Live battery telemetry ingestion and scoring")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="run the ingestion service")
+    serve_parser.add_argument('--stdin', action='store_true', help="ingest stdin until EOF instead of a socket")
+    serve_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="max readings per micro batch")
+    serve_parser.add_argument('--linger', type=float, default=LINGER,
+                              help="seconds to wait for a micro batch to fill")
+    serve_parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                              help="queued readings before the service pushes back on senders")
+
+    load_parser = commands.add_parser('load', help="send generated readings to a running service")
+    load_parser.add_argument('--rows', type=int, default=100_000)
+    load_parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    load_parser.add_argument('--rate', type=float, default=None, help="readings per second (default: unpaced)")
+    load_parser.add_argument('--seed', type=int, default=None)
+
+    for sub in (serve_parser, load_parser):
+        sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('--port', type=int, default=8765)
+        sub.add_argument('--query-port', type=int, default=8766)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            stats = asyncio.run(serve(args.host, args.port, args.query_port, args.stdin,
+                                      args.batch_size, args.linger, args.max_pending))
+        except KeyboardInterrupt:
+            return
+        print(json.dumps(stats))
+        return
+
+    async def run_load():
+        elapsed = await generate_load(args.rows, args.host, args.port, args.format, args.rate, args.seed)
+        # Give the scorer a moment to finish the tail of the stream before asking for stats
+        await asyncio.sleep(0.2)
+        return elapsed, await query('stats', args.host, args.query_port)
+
+    elapsed, stats = asyncio.run(run_load())
+    print(f"Sent {args.rows} readings in {elapsed:.2f}s ({args.rows / elapsed:,.0f}/s)")
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
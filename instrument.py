@@ -0,0 +1,189 @@
+import cProfile
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+# Lightweight tracing of pipeline stages.
+#
+#   with instrument.stage('analysis:read') as s:
+#       df = pd.read_csv(path)
+#       s.rows = len(df)
+#
+# Tracing is configured through environment variables, so it also reaches
+# worker processes, and the CLIs need no extra flags:
+#   BATTERY_TRACE=trace.jsonl        append one JSON line per finished stage
+#   BATTERY_TRACE_MEMORY=1           also record peak allocated memory (tracemalloc,
+#                                    which slows allocation-heavy code noticeably)
+#   BATTERY_PROFILE_STAGE=figure:x   cProfile every run of that stage ...
+#   BATTERY_PROFILE_OUT=x.prof       ... into this file (snakeviz, flameprof, pstats)
+#
+# Each record has the stage name, its parent stage, wall and CPU seconds, rows
+# and rows/s, the process's max RSS so far and, with memory tracing, the peak
+# bytes allocated while the stage ran. With BATTERY_TRACE unset, stage()
+# returns a shared no-op object, so instrumented code costs one global lookup.
+#
+# `python instrument.py trace.jsonl` summarizes a trace per stage.
+
+TRACE_ENV = 'BATTERY_TRACE'
+MEMORY_ENV = 'BATTERY_TRACE_MEMORY'
+PROFILE_STAGE_ENV = 'BATTERY_PROFILE_STAGE'
+PROFILE_OUT_ENV = 'BATTERY_PROFILE_OUT'
+
+_enabled = False
+_settings = {}
+_stack = []
+_trace_file = None
+_profiler = None
+
+
+# (Re)read the settings; configure(trace='trace.jsonl') enables tracing for this
+# process and any worker processes it starts afterwards
+def configure(trace=None, memory=None, profile_stage=None, profile_out=None):
+    global _enabled, _trace_file, _profiler
+    for env, value in ((TRACE_ENV, trace), (MEMORY_ENV, memory),
+                       (PROFILE_STAGE_ENV, profile_stage), (PROFILE_OUT_ENV, profile_out)):
+        if value is not None:
+            os.environ[env] = '1' if value is True else '' if value is False else str(value)
+
+    _settings.update(trace=os.environ.get(TRACE_ENV) or None,
+                     memory=os.environ.get(MEMORY_ENV, '') not in ('', '0'),
+                     profile_stage=os.environ.get(PROFILE_STAGE_ENV) or None,
+                     profile_out=os.environ.get(PROFILE_OUT_ENV) or 'profile.prof')
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+    _profiler = None
+    _enabled = bool(_settings['trace'] or _settings['profile_stage'])
+    if _settings['memory'] and _enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled():
+    return _enabled
+
+
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.parent = _stack[-1] if _stack else None
+        _stack.append(self)
+        if _settings['memory']:
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak() below hides the parent's peak so far; hand it over first
+            if self.parent is not None:
+                self.parent._peak_seen = max(self.parent._peak_seen, peak)
+            tracemalloc.reset_peak()
+            self._start_memory = current
+            self._peak_seen = current
+        self._profiling = self.name == _settings['profile_stage']
+        if self._profiling:
+            _profile().enable()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        if self._profiling:
+            _profiler.disable()
+            _profiler.dump_stats(_settings['profile_out'])
+        _stack.pop()
+
+        record = {'stage': self.name, 'parent': self.parent.name if self.parent else None,
+                  'wall_s': wall, 'cpu_s': cpu, 'rows': self.rows,
+                  'rows_per_s': self.rows / wall if self.rows and wall > 0 else None,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'pid': os.getpid(), 'time': time.time(), 'status': 'error' if exc_type else 'ok'}
+        if _settings['memory']:
+            peak = max(self._peak_seen, tracemalloc.get_traced_memory()[1])
+            record['peak_alloc_mb'] = (peak - self._start_memory) / 2 ** 20
+            if self.parent is not None:
+                self.parent._peak_seen = max(self.parent._peak_seen, peak)
+        _write(record)
+        return False
+
+
+def stage(name, rows=None):
+    if not _enabled:
+        return _NULL
+    return _Stage(name, rows)
+
+
+# One profiler per process, so repeated runs of the profiled stage accumulate
+def _profile():
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    return _profiler
+
+
+def _write(record):
+    global _trace_file
+    if not _settings['trace']:
+        return
+    if _trace_file is None:
+        # Line-buffered appends keep lines from several worker processes whole
+        _trace_file = open(_settings['trace'], 'a', buffering=1, encoding='utf-8')
+    _trace_file.write(json.dumps(record) + '\n')
+
+
+# Totals per stage from one or more trace files
+def summarize(paths):
+    import pandas as pd
+
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    aggregations = {'runs': ('stage', 'size'), 'wall_s': ('wall_s', 'sum'), 'cpu_s': ('cpu_s', 'sum'),
+                    'rows': ('rows', 'sum'), 'max_rss_mb': ('max_rss_mb', 'max')}
+    if 'peak_alloc_mb' in df.columns:
+        aggregations['peak_alloc_mb'] = ('peak_alloc_mb', 'max')
+    summary = df.groupby('stage').agg(**aggregations)
+    summary['rows_per_s'] = summary['rows'] / summary['wall_s']
+    return summary.sort_values('wall_s', ascending=False)
+
+
+configure()
+
+
+def main(argv=None):
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Summarize pipeline trace files per stage")
+    parser.add_argument('traces', nargs='+')
+    args = parser.parse_args(argv)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(summarize(args.traces).round(3))
+
+
+if __name__ == '__main__':
+    main()
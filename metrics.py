@@ -0,0 +1,332 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+# Vectorized versions of the row-wise calculate_* functions in analysis.py.
+# Every function takes the whole DataFrame and returns one column, using the
+# same thresholds and weights as the originals.
+#
+# Each derived column is registered together with the columns it reads, so a
+# caller can ask for any target column and only its transitive dependencies
+# get computed. Results are memoized per DataFrame (which is treated as
+# read-only input), so asking again for a column already computed is free.
+
+LIFE_SPAN_DAYS = 'Life Span Remaining (days)'
+
+# Bands used to group the fleet in plots and queries
+SOH_BINS = [0, 70, 80, 90, 100]
+SOH_LABELS = ['Critical (<70%)', 'Poor (70-80%)', 'Good (80-90%)', 'Excellent (>90%)']
+TEMP_BINS = [-20, 0, 20, 40, 60]
+TEMP_LABELS = ['Below 0°C', '0-20°C', '20-40°C', 'Above 40°C']
+RATE_LABELS = ['Slow', 'Moderate', 'Fast']
+# Battery Health Score tiers; each bin includes its lower edge
+HEALTH_BINS = [0, 60, 70, 80, 90, np.inf]
+HEALTH_LABELS = ['Critical', 'Poor', 'Fair', 'Good', 'Excellent']
+
+# Decimal places sensor readings are recorded with (as DataSet.py rounds them).
+# Compact frames hold these columns as float32; they are widened back to
+# exactly these decimals before any metric reads them, so results match float64 input.
+SENSOR_DECIMALS = {
+    'State of Charge (SOC) (%)': 2,
+    'State of Health (SOH) (%)': 2,
+    'Initial Rated Capacity (Ah)': 1,
+    'Full Charge Capacity (Ah)': 1,
+    'Voltage (V)': 3,
+    'Temperature (°C)': 1,
+    'Internal Resistance (mΩ)': 2,
+}
+
+# column -> (input columns, function)
+REGISTRY = {}
+
+
+def register(column, inputs):
+    def decorator(function):
+        REGISTRY[column] = (list(inputs), function)
+        return function
+    return decorator
+
+
+class Plan:
+    # Ordered list of registered columns to compute so that every step's inputs
+    # are available by the time it runs
+    def __init__(self, targets, steps):
+        self.targets = list(targets)
+        self.steps = steps
+
+    def __repr__(self):
+        return f"Plan(targets={self.targets}, steps={self.steps})"
+
+    # Returns {column: Series} for the targets, reusing anything memoized for df
+    def execute(self, df):
+        computed = _memo_for(df)
+        view = _Frame(df, computed)
+        for column in self.steps:
+            if column not in computed:
+                with instrument.stage(f"metric:{column}", len(df)):
+                    computed[column] = REGISTRY[column][1](view)
+        return {column: view[column] for column in self.targets}
+
+
+# Build a plan for `targets` given the columns that already exist. Raises KeyError
+# naming the missing input if a target cannot be derived.
+def plan(targets, columns=()):
+    columns = set(columns)
+    steps = []
+
+    def visit(column, path):
+        if column in columns or column in steps:
+            return
+        if column not in REGISTRY:
+            raise KeyError(f"column '{column}' is missing and no metric is registered for it"
+                           + (f" (needed by '{path[-1]}')" if path else ""))
+        if column in path:
+            raise ValueError(f"circular metric dependency: {' -> '.join(path + [column])}")
+        for dependency in REGISTRY[column][0]:
+            visit(dependency, path + [column])
+        steps.append(column)
+
+    for target in targets:
+        visit(target, [])
+    return Plan(targets, steps)
+
+
+# True if `target` exists in `columns` or can be derived from them
+def available(target, columns):
+    try:
+        plan([target], columns)
+    except KeyError:
+        return False
+    return True
+
+
+# The columns among `columns` that computing `targets` reads, in their original order
+def inputs(targets, columns):
+    steps = plan(targets, columns).steps
+    needed = set(targets).union(*(REGISTRY[column][0] for column in steps))
+    return [c for c in columns if c in needed]
+
+
+# Return a copy of df with the target columns added (existing columns are kept as-is)
+def compute(df, targets):
+    values = plan(targets, df.columns).execute(df)
+    # Shallow copy: the input's columns are shared, only the new ones are added
+    df = df.copy(deep=False)
+    for column in targets:
+        if column not in df.columns:
+            df[column] = values[column]
+    return df
+
+
+# Memoized results are keyed by the DataFrame's id and released when it is garbage collected
+_memos = {}
+
+
+def _memo_for(df):
+    key = id(df)
+    if key not in _memos:
+        _memos[key] = {}
+        weakref.finalize(df, _memos.pop, key, None)
+    return _memos[key]
+
+
+class _Frame:
+    # Read-only view of a DataFrame plus the metric columns computed for it so far
+    def __init__(self, df, computed):
+        self._df = df
+        self._computed = computed
+        self.index = df.index
+
+    def __getitem__(self, column):
+        if column in self._computed:
+            return self._computed[column]
+        return widen(self._df[column])
+
+
+# float32 sensor readings back to the float64 values they were recorded as
+def widen(values):
+    if values.dtype == np.float32 and values.name in SENSOR_DECIMALS:
+        return values.astype(np.float64).round(SENSOR_DECIMALS[values.name])
+    return values
+
+
+# Battery efficiency in percentage
+@register('Efficiency (%)', ['State of Health (SOH) (%)', 'State of Charge (SOC) (%)'])
+def efficiency(df):
+    soh = df['State of Health (SOH) (%)']
+    soc = df['State of Charge (SOC) (%)']
+
+    # Weights can be tuned based on real-world data or domain knowledge
+    return np.clip(0.6 * soh + 0.4 * soc, 0, 100)
+
+
+# Remaining battery life span in days on the 12 x 30-day calendar the
+# "X years, Y months, Z days" string uses, so the two convert losslessly
+@register(LIFE_SPAN_DAYS, ['Cycle Count', 'State of Health (SOH) (%)'])
+def life_span_days(df):
+    max_cycles = 2000  # Max cycles a battery can undergo in its full life
+    cycle_degradation_rate = 0.5  # Battery degradation per cycle (in years)
+
+    remaining_cycles = max_cycles - df['Cycle Count'].to_numpy()
+    remaining_years = remaining_cycles * cycle_degradation_rate * (df['State of Health (SOH) (%)'].to_numpy() / 100)
+
+    years = np.floor(remaining_years)
+    remaining_months = np.floor((remaining_years - years) * 12)
+    remaining_days = np.floor(((remaining_years - years) * 12 - remaining_months) * 30)
+
+    days = (years.astype(np.int64) % 15) * 360 + remaining_months.astype(np.int64) * 30 + remaining_days.astype(np.int64)
+    return pd.Series(days, index=df.index)
+
+
+# Format a life span in days as "X years, Y months, Z days"
+def format_life_span(days):
+    years = (days // 360).astype(str)
+    months = (days % 360 // 30).astype(str)
+    days = (days % 30).astype(str)
+    return years + " years, " + months + " months, " + days + " days"
+
+
+# Parse "X years, Y months, Z days" strings back into a life span in days. There
+# are at most a few thousand distinct spans, so only the unique strings are parsed.
+def parse_life_span(text):
+    codes, uniques = pd.factorize(text)
+    if (codes < 0).any():
+        raise ValueError("missing life span")
+    parts = pd.Series(uniques, dtype=object).str.extract(r'(\d+) years, (\d+) months, (\d+) days').astype(np.int64)
+    days = (parts[0] * 360 + parts[1] * 30 + parts[2]).to_numpy()
+    return pd.Series(days[codes], index=text.index)
+
+
+# Remaining battery life span as "X years, Y months, Z days"
+@register('Life Span Remaining', [LIFE_SPAN_DAYS])
+def life_span(df):
+    return format_life_span(df[LIFE_SPAN_DAYS])
+
+
+# Charging/Discharging Rate based on Voltage, Temperature, and Internal Resistance
+@register('Charging/Discharging Rate', ['Voltage (V)', 'Temperature (°C)', 'Internal Resistance (mΩ)'])
+def charging_discharge_rate(df):
+    voltage = df['Voltage (V)']
+    temp = df['Temperature (°C)']
+    resistance = df['Internal Resistance (mΩ)']
+
+    conditions = [
+        (voltage > 4.0) & (temp < 30) & (resistance < 50),
+        (voltage > 3.7) & (temp < 35) & (resistance < 75),
+    ]
+    rate = np.select(conditions, ['Fast', 'Moderate'], default='Slow')
+    return pd.Series(rate, index=df.index)
+
+
+# Capacity fade in percentage (NaN where the initial capacity is 0)
+@register('Capacity Fade (%)', ['Initial Rated Capacity (Ah)', 'Full Charge Capacity (Ah)'])
+def capacity_fade(df):
+    initial_capacity = df['Initial Rated Capacity (Ah)']
+    full_capacity = df['Full Charge Capacity (Ah)']
+
+    fade = (1 - (full_capacity / initial_capacity)) * 100
+    return fade.where(initial_capacity != 0)
+
+
+# Temperature Stress Factor (0-100), lithium-ion batteries are happiest at 20-25°C
+@register('Temperature Stress Factor', ['Temperature (°C)'])
+def temperature_stress(df):
+    temp = df['Temperature (°C)']
+
+    conditions = [
+        (temp >= 20) & (temp <= 25),  # Ideal temperature range, no stress
+        ((temp >= 15) & (temp < 20)) | ((temp > 25) & (temp <= 30)),  # Slight stress
+        ((temp >= 10) & (temp < 15)) | ((temp > 30) & (temp <= 35)),  # Moderate stress
+        ((temp >= 5) & (temp < 10)) | ((temp > 35) & (temp <= 40)),  # High stress
+        ((temp >= 0) & (temp < 5)) | ((temp > 40) & (temp <= 45)),  # Very high stress
+    ]
+    # Extreme stress below 0°C or above 45°C
+    stress = np.select(conditions, [0, 20, 40, 60, 80], default=100)
+    return pd.Series(stress, index=df.index)
+
+
+# Voltage Stability Rating (1-10, 10 being most stable)
+@register('Voltage Stability Rating', ['Voltage (V)', 'State of Charge (SOC) (%)'])
+def voltage_stability(df):
+    voltage = df['Voltage (V)']
+    soc = df['State of Charge (SOC) (%)']
+
+    # Simple linear model from 3.2V (0% SOC) to 4.2V (100% SOC)
+    expected_voltage = 3.2 + (soc / 100) * 1.0
+    deviation = abs(voltage - expected_voltage)
+
+    # Every 0.05V of deviation costs one point, down to a rating of 1
+    bins = [0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45]
+    rating = 10 - np.digitize(deviation, bins)
+    return pd.Series(rating, index=df.index)
+
+
+# Battery Health Score (0-100), needs Temperature Stress Factor and Voltage Stability Rating
+@register('Battery Health Score', ['State of Health (SOH) (%)', 'Internal Resistance (mΩ)', 'Cycle Count',
+                                  'Temperature Stress Factor', 'Voltage Stability Rating'])
+def health_score(df):
+    soh_weight = 0.35
+    resistance_weight = 0.25
+    temp_stress_weight = 0.15
+    voltage_stability_weight = 0.15
+    cycle_count_weight = 0.10
+
+    # Normalize cycle count (assuming max_cycles = 2000)
+    max_cycles = 2000
+    normalized_cycles = (1 - np.minimum(df['Cycle Count'] / max_cycles, 1)) * 100
+
+    # Normalize resistance (lower is better), typical range is 20-150 mΩ
+    normalized_resistance = np.clip((150 - df['Internal Resistance (mΩ)']) / 1.3, 0, 100)
+
+    health = (
+        soh_weight * df['State of Health (SOH) (%)'] +
+        resistance_weight * normalized_resistance +
+        temp_stress_weight * (100 - df['Temperature Stress Factor']) +  # Invert so lower stress is better
+        voltage_stability_weight * (df['Voltage Stability Rating'] * 10) +
+        cycle_count_weight * normalized_cycles
+    )
+
+    # Round to nearest integer
+    return np.round(health).astype(np.int64)
+
+
+# Whole years of remaining life, as shown in the "X years" part of the life span string
+@register('Life Span Years', [LIFE_SPAN_DAYS])
+def life_span_years(df):
+    return df[LIFE_SPAN_DAYS] // 360
+
+
+@register('SOH Range', ['State of Health (SOH) (%)'])
+def soh_range(df):
+    return pd.cut(df['State of Health (SOH) (%)'], bins=SOH_BINS, labels=SOH_LABELS)
+
+
+@register('Temp Range', ['Temperature (°C)'])
+def temp_range(df):
+    return pd.cut(df['Temperature (°C)'], bins=TEMP_BINS, labels=TEMP_LABELS)
+
+
+@register('Health Status', ['Battery Health Score'])
+def health_status(df):
+    return pd.cut(df['Battery Health Score'], bins=HEALTH_BINS, labels=HEALTH_LABELS, right=False)
+
+
+# The columns analysis.py writes, in the order it has always written them
+ANALYSIS_COLUMNS = [
+    'Efficiency (%)',
+    'Life Span Remaining',
+    'Charging/Discharging Rate',
+    'Temperature Stress Factor',
+    'Voltage Stability Rating',
+    'Battery Health Score',
+    'Capacity Fade (%)',
+]
+
+
+# Add all analysis columns. Metrics whose inputs are missing from df (older
+# exports have no capacity columns, for example) are skipped.
+def compute_metrics(df):
+    return compute(df, [c for c in ANALYSIS_COLUMNS if available(c, df.columns)])
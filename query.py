@@ -0,0 +1,309 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import storage
+
+# Indexed queries over an analysed fleet, e.g. "the 100 batteries with the
+# lowest Battery Health Score and Temperature Stress Factor >= 60".
+#
+# An index directory holds:
+#   data/                 the analysed rows as a column store (storage.write_column_store)
+#   sorted/<i>.order.npy  row ids of a numeric column in ascending value order
+#   sorted/<i>.values.npy the column's values in that order, for binary search
+#   bitmaps/<i>.npy       one packed bitmap per category of a band column
+#   index.json            row count, column -> file mapping, category counts
+#
+# Everything is opened with mmap on first use, so opening an index is cheap
+# and a query only touches the pages of the columns it filters on. Filters
+# follow storage.load_dataset's (column, op, value) convention and are ANDed.
+# The most selective indexed filter produces the candidate row ids and the
+# rest are checked on just those rows. Top-k queries walk the sort order of
+# the ranking column and stop as soon as k rows pass the filters.
+
+INDEX_NAME = 'index.json'
+
+BITMAP_COLUMNS = ['SOH Range', 'Temp Range', 'Charging/Discharging Rate', 'Health Status']
+
+RANGE_OPS = {
+    '==': lambda s, v: s == v,
+    '=': lambda s, v: s == v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+}
+# searchsorted sides bounding the matching run of a sorted column (None = open end)
+SEARCH_SIDES = {
+    '==': ('left', 'right'),
+    '=': ('left', 'right'),
+    '<': (None, 'left'),
+    '<=': (None, 'right'),
+    '>': ('right', None),
+    '>=': ('left', None),
+}
+OTHER_OPS = {
+    '!=': lambda s, v: s != v,
+    'in': lambda s, v: np.isin(s, v),
+    'not in': lambda s, v: ~np.isin(s, v),
+}
+
+
+def build_index(df, directory):
+    df = storage.to_columnar(df)
+    df = metrics.compute(df, [c for c in BITMAP_COLUMNS if metrics.available(c, df.columns)])
+    df = df.reset_index(drop=True)
+    for sub in ('data', 'sorted', 'bitmaps'):
+        os.makedirs(os.path.join(directory, sub), exist_ok=True)
+    storage.write_column_store(df, os.path.join(directory, 'data'))
+    with open(os.path.join(directory, 'data', 'columns.json'), encoding='utf-8') as f:
+        data = json.load(f)
+
+    # File names are copied here so numeric lookups never parse the category
+    # lists in data/columns.json
+    meta = {'rows': len(df), 'sorted': {}, 'bitmaps': {},
+            'data': {c: {'file': e['file'], 'categorical': 'categories' in e, 'battery_ids': 'prefix' in e}
+                     for c, e in data.items()}}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if column in BITMAP_COLUMNS:
+            codes = values.astype('category').cat.codes.to_numpy()
+            categories = values.astype('category').cat.categories.tolist()
+            bitmaps = np.stack([np.packbits(codes == code) for code in range(len(categories))])
+            np.save(os.path.join(directory, 'bitmaps', f"{i:03d}.npy"), bitmaps)
+            meta['bitmaps'][column] = {'file': f"{i:03d}.npy", 'categories': categories,
+                                       'counts': np.bincount(codes[codes >= 0],
+                                                             minlength=len(categories)).tolist()}
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.to_numpy()
+            order = np.argsort(values, kind='stable')
+            np.save(os.path.join(directory, 'sorted', f"{i:03d}.order.npy"), order)
+            np.save(os.path.join(directory, 'sorted', f"{i:03d}.values.npy"), values[order])
+            # NaNs sort last; `valid` is where they start
+            meta['sorted'][column] = {'file': f"{i:03d}", 'valid': int(np.count_nonzero(~np.isnan(values)))
+                                      if values.dtype.kind == 'f' else len(values)}
+
+    with open(os.path.join(directory, INDEX_NAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return FleetIndex(directory)
+
+
+class FleetIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.rows = meta['rows']
+        self.data_files = meta['data']
+        self.columns = list(self.data_files)
+        self.sorted_columns = meta['sorted']
+        self.bitmap_columns = meta['bitmaps']
+        self._arrays = {}
+        self._dtypes = None
+
+    def _load(self, key, *parts):
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.directory, *parts), mmap_mode='r')
+        return self._arrays[key]
+
+    def _order(self, column):
+        return self._load(('order', column), 'sorted', self.sorted_columns[column]['file'] + '.order.npy')
+
+    def _sorted_values(self, column):
+        return self._load(('values', column), 'sorted', self.sorted_columns[column]['file'] + '.values.npy')
+
+    def _bitmaps(self, column):
+        return self._load(('bitmaps', column), 'bitmaps', self.bitmap_columns[column]['file'])
+
+    # Values of one data column at the given row positions
+    def _values(self, column, rows):
+        entry = self.data_files[column]
+        values = self._load(('data', column), 'data', entry['file'])[rows]
+        if entry['categorical']:
+            values = pd.Categorical.from_codes(values, dtype=self._dtype(column))
+        elif entry.get('battery_ids'):
+            # "Battery N" labels are stored as N and only built for the rows fetched
+            values = storage.decode_batteries(values).to_numpy()
+        return values
+
+    # Building a categorical dtype hashes every category, so it is done once per column
+    def _dtype(self, column):
+        if self._dtypes is None:
+            with open(os.path.join(self.directory, 'data', 'columns.json'), encoding='utf-8') as f:
+                self._dtypes = {c: e for c, e in json.load(f).items() if 'categories' in e}
+        entry = self._dtypes[column]
+        if isinstance(entry, dict):
+            entry = self._dtypes[column] = pd.CategoricalDtype(entry['categories'], ordered=entry['ordered'])
+        return entry
+
+    # Resolve one filter into an estimated row count plus functions producing
+    # its row ids (None if it cannot drive the query) and testing given rows
+    def _resolve(self, column, op, value):
+        if column in self.bitmap_columns:
+            return self._resolve_bitmap(column, op, value)
+        if column not in self.columns:
+            raise KeyError(f"column '{column}' is not in the index")
+        if op not in RANGE_OPS and op not in OTHER_OPS:
+            raise ValueError(f"unsupported operator '{op}'")
+        test = lambda rows: _compare(op, np.asarray(self._values(column, rows)), value)
+        if column not in self.sorted_columns or op not in RANGE_OPS:
+            return self.rows, None, test
+
+        values = self._sorted_values(column)[:self.sorted_columns[column]['valid']]
+        low_side, high_side = SEARCH_SIDES[op]
+        lo = np.searchsorted(values, value, low_side) if low_side else 0
+        hi = np.searchsorted(values, value, high_side) if high_side else len(values)
+        return hi - lo, lambda: np.sort(self._order(column)[lo:hi]), test
+
+    def _resolve_bitmap(self, column, op, value):
+        entry = self.bitmap_columns[column]
+        wanted = [value] if op in ('==', '=', '!=') else list(value)
+        unknown = [v for v in wanted if v not in entry['categories']]
+        if unknown or op not in ('==', '=', '!=', 'in', 'not in'):
+            raise ValueError(f"filter ({column!r}, {op!r}, {value!r}) is not valid; "
+                             f"'{column}' takes ==, !=, in, not in with one of {entry['categories']}")
+        codes = [entry['categories'].index(v) for v in wanted]
+        bits = np.bitwise_or.reduce(self._bitmaps(column)[codes], axis=0) if codes \
+            else np.zeros(-(-self.rows // 8), dtype=np.uint8)
+        count = sum(entry['counts'][c] for c in codes)
+        if op in ('!=', 'not in'):
+            bits = ~bits
+            count = self.rows - count
+
+        def rows():
+            return np.flatnonzero(np.unpackbits(bits, count=self.rows))
+
+        def test(rows):
+            return (bits[rows >> 3] >> (7 - (rows & 7))) & 1 == 1
+
+        return count, rows, test
+
+    # Row ids matching every filter, in ascending order
+    def select_rows(self, filters=()):
+        resolved = [self._resolve(*f) for f in filters]
+        drivers = [r for r in resolved if r[1] is not None]
+        if not drivers:
+            rows = np.arange(self.rows)
+        else:
+            driver = min(drivers, key=lambda r: r[0])
+            if driver[0] == 0:
+                return np.zeros(0, dtype=np.int64)
+            rows = driver[1]()
+            resolved = [r for r in resolved if r is not driver]
+        return _apply(rows, resolved)
+
+    # Row ids of the k rows with the smallest (or largest) `by` that match every filter
+    def top_rows(self, k, by, filters=(), ascending=True):
+        resolved = [self._resolve(*f) for f in filters]
+        if by not in self.sorted_columns:
+            rows = self.select_rows(filters)
+            values = pd.Series(self._values(by, rows), index=rows)
+            if pd.api.types.is_numeric_dtype(values):
+                values = values.nsmallest(k) if ascending else values.nlargest(k)
+            else:
+                values = values.sort_values(ascending=ascending, kind='stable').head(k)
+            return values.index.to_numpy()
+
+        valid = self.sorted_columns[by]['valid']
+        order = self._order(by)[:valid]
+        if not ascending:
+            order = order[::-1]
+        found = []
+        start, block = 0, max(4 * k, 1024)
+        while start < len(order) and sum(len(f) for f in found) < k:
+            rows = np.asarray(order[start:start + block])
+            found.append(_apply(rows, resolved, keep_order=True))
+            start += block
+            block *= 2
+        rows = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+        return rows[:k]
+
+    def fetch(self, rows, columns=None):
+        data = {column: self._values(column, rows) for column in columns or self.columns}
+        return pd.DataFrame(data, index=pd.Index(rows, name='row'))
+
+    def select(self, filters=(), columns=None):
+        return self.fetch(self.select_rows(filters), columns)
+
+    def top(self, k, by, filters=(), ascending=True, columns=None):
+        return self.fetch(self.top_rows(k, by, filters, ascending), columns)
+
+
+def _compare(op, values, value):
+    return {**RANGE_OPS, **OTHER_OPS}[op](values, value)
+
+
+def _apply(rows, resolved, keep_order=False):
+    # Cheapest check first so later ones see fewer rows
+    for _, _, test in sorted(resolved, key=lambda r: r[0]):
+        if len(rows) == 0:
+            break
+        rows = rows[test(rows)]
+    return rows if keep_order else np.sort(rows)
+
+
+# Open an index for `source`, rebuilding it when the source file has changed
+def open_index(source, directory):
+    stamp = os.path.join(directory, 'source.json')
+    info = {'path': os.path.abspath(source), 'size': os.path.getsize(source),
+            'mtime_ns': os.stat(source).st_mtime_ns}
+    try:
+        with open(stamp, encoding='utf-8') as f:
+            if json.load(f) == info:
+                return FleetIndex(directory)
+    except (FileNotFoundError, ValueError):
+        pass
+    index = build_index(storage.load_dataset(source), directory)
+    with open(stamp, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return index
+
+
+# "Temperature Stress Factor>=60", "SOH Range==Poor (70-80%)", "Health Status in Poor|Critical"
+def parse_filter(text, index):
+    match = re.match(r'^(.+?)\s*(==|!=|>=|<=|>|<|=| not in | in )\s*(.+)$', text)
+    if not match:
+        raise ValueError(f"cannot parse filter '{text}'")
+    column, op, value = match.group(1).strip(), match.group(2).strip(), match.group(3).strip()
+    values = value.split('|') if op in ('in', 'not in') else [value]
+    if column not in index.bitmap_columns:
+        try:
+            values = [float(v) for v in values]
+        except ValueError:
+            pass
+    return column, op, values if op in ('in', 'not in') else values[0]
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Indexed queries over an analysed battery dataset")
+    parser.add_argument('--input', default='AnalysedData/battery_health_predictions_updated.csv')
+    parser.add_argument('--index-dir', default='AnalysedData/index')
+    parser.add_argument('--where', action='append', default=[],
+                        help="filter such as 'Temperature Stress Factor>=60' (repeat to AND)")
+    parser.add_argument('--top', type=int, default=None, help="only the k best/worst rows")
+    parser.add_argument('--by', default='Battery Health Score', help="ranking column for --top")
+    parser.add_argument('--descending', action='store_true', help="rank from the largest value")
+    parser.add_argument('--columns', nargs='+', default=None, help="columns to print")
+    args = parser.parse_args(argv)
+
+    index = open_index(args.input, args.index_dir)
+    filters = [parse_filter(w, index) for w in args.where]
+    started = time.perf_counter()
+    if args.top:
+        result = index.top(args.top, args.by, filters, not args.descending, args.columns)
+    else:
+        result = index.select(filters, args.columns)
+    elapsed = time.perf_counter() - started
+    print(result)
+    print(f"{len(result)} rows in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import density
+
+# Scale-independent rendering for scatter and hexbin style plots.
+#
+# Below AGGREGATE_THRESHOLD points the normal matplotlib artists are used.
+# Above it the points are pre-binned into a fixed pixel grid with np.bincount
+# (counts, plus the mean of the colour column per pixel) and the grid is drawn
+# with a single imshow, so render time and file size depend on the grid
+# resolution rather than on the number of batteries. The threshold can be
+# changed here or with the AGGREGATE_THRESHOLD environment variable.
+
+AGGREGATE_THRESHOLD = int(os.environ.get('AGGREGATE_THRESHOLD', 200_000))
+
+
+def _grid_shape(ax, bins):
+    if bins is not None:
+        return bins
+    # One cell per screen pixel of the axes
+    bbox = ax.get_window_extent()
+    return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+
+def _bin_indices(values, n):
+    low, high = np.nanmin(values), np.nanmax(values)
+    if high == low:
+        high = low + 1
+    index = ((values - low) * (n / (high - low))).astype(np.int64)
+    return np.clip(index, 0, n - 1), (low, high)
+
+
+# Returns (count, mean of c or None, extent) on an nx by ny grid, with rows indexed by y
+def bin_points(x, y, c=None, bins=(512, 512)):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if c is not None:
+        c = np.asarray(c, dtype=np.float64)
+        keep &= np.isfinite(c)
+        c = c[keep]
+    x, y = x[keep], y[keep]
+
+    nx, ny = bins
+    ix, (x0, x1) = _bin_indices(x, nx)
+    iy, (y0, y1) = _bin_indices(y, ny)
+    cell = iy * nx + ix
+
+    count = np.bincount(cell, minlength=nx * ny).reshape(ny, nx)
+    mean = None
+    if c is not None:
+        total = np.bincount(cell, weights=c, minlength=nx * ny).reshape(ny, nx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+    return count, mean, (x0, x1, y0, y1)
+
+
+# Drop-in for ax.scatter(x, y, c=c, cmap=cmap, **kwargs). Above the threshold
+# each pixel is coloured by the mean of c (or by count when c is None) and the
+# marker styling kwargs no longer apply.
+def scatter(ax, x, y, c=None, cmap=None, threshold=None, bins=None, **kwargs):
+    threshold = AGGREGATE_THRESHOLD if threshold is None else threshold
+    if len(x) <= threshold:
+        return ax.scatter(x, y, c=c, cmap=cmap, **kwargs)
+
+    count, mean, extent = bin_points(x, y, c, _grid_shape(ax, bins))
+    image = count if mean is None else mean
+    image = np.ma.masked_where(count == 0, image)
+    return ax.imshow(image, origin='lower', extent=extent, aspect='auto',
+                     cmap=cmap, interpolation='nearest')
+
+
+# Drop-in for ax.hexbin(x, y, gridsize=..., mincnt=1). Above the threshold the
+# counts are drawn as a square-cell density image instead of hexagons.
+def hexbin(ax, x, y, gridsize=100, cmap=None, mincnt=1, threshold=None, bins=None, **kwargs):
+    threshold = AGGREGATE_THRESHOLD if threshold is None else threshold
+    if len(x) <= threshold:
+        return ax.hexbin(x, y, gridsize=gridsize, cmap=cmap, mincnt=mincnt, **kwargs)
+
+    # Keep the coarse look of the hexbin by default: gridsize cells in each direction
+    count, _, extent = bin_points(x, y, None, bins or (gridsize, gridsize))
+    image = np.ma.masked_where(count < max(mincnt, 1), count)
+    return ax.imshow(image, origin='lower', extent=extent, aspect='auto',
+                     cmap=cmap, interpolation='nearest')
+
+
+# Filled density curve per group from the binned FFT KDE, standing in for
+# sns.kdeplot(hue=..., fill=True, common_norm=False) on large fleets
+def kde_by_group(ax, values, groups, palette='viridis', alpha=0.5, linewidth=2, title=None):
+    import seaborn as sns
+
+    groups = pd.Categorical(groups)
+    grid, densities = density.grouped_kde(values, groups.codes, len(groups.categories))
+    colors = sns.color_palette(palette, len(groups.categories))
+    for label, curve, color in zip(groups.categories, densities, colors):
+        ax.fill_between(grid, curve, color=color, alpha=alpha, linewidth=0)
+        ax.plot(grid, curve, color=color, linewidth=linewidth, label=str(label))
+    ax.legend(title=title)
+
+
+# Histogram with a KDE line scaled to counts, standing in for sns.histplot(kde=True)
+def histogram_with_kde(ax, values, bins=20, color=None, edgecolor=None):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    ax.stairs(counts, edges, fill=True, color=color, alpha=0.75)
+    ax.stairs(counts, edges, color=edgecolor)
+    grid, curve = density.kde(values)
+    ax.plot(grid, curve * len(values) * (edges[1] - edges[0]), color=color)
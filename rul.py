@@ -0,0 +1,213 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import storage
+from DataSet import capacity_ranges
+
+# Remaining useful life (RUL) from degradation curves fitted to the fleet,
+# instead of the fixed max_cycles / cycle_degradation_rate constants of
+# calculate_life_span.
+#
+# SOH is modelled as a straight line in cycle count per group (Battery Model
+# when the data has one, otherwise the capacity class). Each group keeps only
+# the sufficient statistics of its least-squares fit (n, sums of x, y, xx, xy,
+# yy), which are accumulated with np.bincount over all groups at once. New data
+# therefore updates a saved model by simply adding its statistics, and all
+# groups are solved together in one vectorized pass.
+#
+# A battery reaches end of life when its SOH falls to EOL_SOH. Its RUL is the
+# distance to that level along its group's slope, starting from the battery's
+# own current SOH, so batteries above or below the group curve keep their offset.
+
+EOL_SOH = 70  # Start of the Critical (<70%) SOH band
+CYCLES_PER_DAY = 1.2  # Usage rate the lifespan plot has always assumed
+MIN_SAMPLES = 30  # Smaller groups fall back to the fleet-wide fit
+
+STATS = ['n', 'x', 'y', 'xx', 'xy', 'yy']
+
+# Batteries at the SOH floor of the data carry no slope information
+SOH_FLOOR = 60
+
+# Statistics of batteries without a group (no model or capacity column, or a
+# missing capacity). They count towards the fleet-wide fit their RUL comes from.
+UNGROUPED = 'ungrouped'
+
+
+# Capacity class (small/medium/large) from the rated capacity, split halfway
+# between the generator's capacity ranges; a missing capacity has no class
+def capacity_class(capacity):
+    names = list(capacity_ranges)
+    bounds = [(capacity_ranges[a][1] + capacity_ranges[b][0]) / 2 for a, b in zip(names, names[1:])]
+    capacity = np.asarray(capacity, dtype=np.float64)
+    codes = np.where(np.isnan(capacity), -1, np.digitize(capacity, bounds))
+    return pd.Categorical.from_codes(codes, names)
+
+
+# Group of every battery as a Categorical; code -1 where there is none
+def groups_of(df):
+    if 'Battery Model' in df.columns:
+        return pd.Categorical(df['Battery Model'].astype(str))
+    if 'Initial Rated Capacity (Ah)' in df.columns:
+        return capacity_class(df['Initial Rated Capacity (Ah)'])
+    return pd.Categorical.from_codes(np.full(len(df), -1), [])
+
+
+class DegradationModel:
+    def __init__(self, stats=None, sources=None):
+        # group -> sufficient statistics in STATS order
+        self.stats = {} if stats is None else {g: np.asarray(s, dtype=np.float64) for g, s in stats.items()}
+        # file path -> content hash of every file already folded into the statistics
+        self.sources = {} if sources is None else dict(sources)
+        self._params = None
+
+    # Add the statistics of a chunk of batteries to the model
+    def update(self, df):
+        x = df['Cycle Count'].to_numpy(dtype=np.float64)
+        y = df['State of Health (SOH) (%)'].to_numpy(dtype=np.float64)
+        groups = groups_of(df)
+        keep = np.isfinite(x) & np.isfinite(y) & (y > SOH_FLOOR)
+        size = len(groups.categories)
+        # Ungrouped batteries go to the extra slot at the end
+        codes = np.where(groups.codes >= 0, groups.codes, size)[keep]
+        x, y = x[keep], y[keep]
+
+        sums = np.stack([np.bincount(codes, weights=w, minlength=size + 1)
+                         for w in (np.ones_like(x), x, y, x * x, x * y, y * y)], axis=1)
+        for group, row in zip(list(groups.categories) + [UNGROUPED], sums):
+            if group == UNGROUPED and row[0] == 0:
+                continue
+            self.stats[group] = self.stats.get(group, np.zeros(len(STATS))) + row
+        self._params = None
+        return self
+
+    def merge(self, other):
+        for group, row in other.stats.items():
+            self.stats[group] = self.stats.get(group, np.zeros(len(STATS))) + row
+        self.sources.update(other.sources)
+        self._params = None
+        return self
+
+    # Fitted (intercept, slope, residual std, n) per group, plus the fleet-wide
+    # fit under the key None for groups that are missing or too small
+    def params(self):
+        if self._params is None:
+            groups = list(self.stats)
+            sums = np.array([self.stats[g] for g in groups]).reshape(-1, len(STATS))
+            sums = np.vstack([sums, sums.sum(axis=0)])
+            self._params = dict(zip(groups + [None], _solve(sums)))
+        return self._params
+
+    # Vectorized RUL for every battery in df, as a DataFrame with
+    # 'RUL (cycles)' and 'RUL (days)'. Batteries whose group shows no
+    # degradation get NaN.
+    def predict(self, df):
+        params = self.params()
+        fleet = params[None]
+        groups = groups_of(df).set_categories([g for g in params if g is not None])
+        table = np.array([params[g] if params[g][3] >= MIN_SAMPLES else fleet for g in groups.categories]
+                         + [fleet]).reshape(-1, 4)
+        # Unknown groups (code -1) pick the fleet row at the end of the table
+        slope = table[groups.codes, 1]
+
+        soh = df['State of Health (SOH) (%)'].to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cycles = np.where(slope < 0, np.maximum(soh - EOL_SOH, 0) / -slope, np.nan)
+        return pd.DataFrame({'RUL (cycles)': cycles, 'RUL (days)': cycles / CYCLES_PER_DAY}, index=df.index)
+
+    def to_dict(self):
+        return {'stats': {str(g): s.tolist() for g, s in self.stats.items()}, 'sources': self.sources}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['stats'], d.get('sources'))
+
+    def save(self, file_path):
+        with open(file_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(file_path + '.tmp', file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+# Least-squares line for every row of sufficient statistics at once
+def _solve(sums):
+    n, sx, sy, sxx, sxy, syy = sums.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = n * sxx - sx * sx
+        slope = (n * sxy - sx * sy) / det
+        intercept = (sy - slope * sx) / n
+        rss = syy - 2 * intercept * sy - 2 * slope * sxy + intercept ** 2 * n \
+            + 2 * intercept * slope * sx + slope ** 2 * sxx
+        sigma = np.sqrt(np.maximum(rss, 0) / (n - 2))
+    degenerate = (n < 2) | (det <= 0)
+    slope = np.where(degenerate, np.nan, slope)
+    intercept = np.where(degenerate, np.nan, intercept)
+    return np.stack([intercept, slope, sigma, n], axis=1)
+
+
+# Fold a CSV or Parquet dataset into `model` chunk by chunk, skipping files
+# whose content has already been absorbed
+def fit_file(model, file_path, chunk_size=1_000_000):
+    digest = storage.file_hash(file_path)
+    key = os.path.abspath(file_path)
+    if model.sources.get(key) == digest:
+        return False
+    if key in model.sources:
+        raise ValueError(f"'{file_path}' changed since it was fitted; refit from scratch to replace its data")
+
+    # The group columns are optional; without them everything is fitted fleet-wide
+    columns = ['Cycle Count', 'State of Health (SOH) (%)']
+    optional = ['Initial Rated Capacity (Ah)', 'Battery Model']
+    if str(file_path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        names = pq.read_schema(file_path).names
+        model.update(storage.load_dataset(file_path, columns + [c for c in optional if c in names]))
+    else:
+        header = pd.read_csv(file_path, nrows=0).columns
+        usecols = columns + [c for c in optional if c in header]
+        for chunk in pd.read_csv(file_path, usecols=usecols, chunksize=chunk_size):
+            model.update(chunk)
+    model.sources[key] = digest
+    return True
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit fleet degradation curves and predict remaining useful life")
+    parser.add_argument('--input', nargs='+', default=['DataSets/ev_battery_health_data.csv'])
+    parser.add_argument('--model', default='AnalysedData/degradation_model.json',
+                        help="fitted statistics; new inputs are added to it if it exists")
+    parser.add_argument('--refit', action='store_true', help="start from an empty model")
+    parser.add_argument('--predict', default=None, help="write per-battery RUL for the inputs to this CSV")
+    args = parser.parse_args(argv)
+
+    model = DegradationModel()
+    if os.path.exists(args.model) and not args.refit:
+        model = DegradationModel.load(args.model)
+    updated = [path for path in args.input if fit_file(model, path)]
+    if updated or not os.path.exists(args.model):
+        model.save(args.model)
+    print(f"Fitted {len(updated)} new file(s) into {args.model}")
+    for group, (intercept, slope, sigma, n) in model.params().items():
+        print(f"  {group or 'fleet'}: SOH = {intercept:.2f} {slope:+.5f} * cycles "
+              f"(sigma {sigma:.2f}, n={int(n)})")
+
+    if args.predict:
+        frames = []
+        for path in args.input:
+            df = pd.read_csv(path)
+            frames.append(pd.concat([df[[c for c in ['Battery'] if c in df.columns]], model.predict(df)], axis=1))
+        pd.concat(frames, ignore_index=True).to_csv(args.predict, index=False)
+        print(f"RUL predictions saved to {args.predict}")
+
+
+if __name__ == '__main__':
+    main()
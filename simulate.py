@@ -0,0 +1,163 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import DataSet
+from rul import CYCLES_PER_DAY, EOL_SOH
+
+# Monte Carlo projection of battery replacement dates.
+#
+# Every battery is run forward through `scenarios` futures using the same
+# stochastic model DataSet.py generates the fleet with: a per-battery decay
+# rate, a resistance growth rate, and the ambient temperature effect on
+# resistance. Usage per step is Poisson around CYCLES_PER_DAY.
+# The decay rate is drawn only from the part of DECAY_RATE_RANGE consistent
+# with the battery's current SOH and cycle count (within ±SOH_NOISE), so each
+# future continues from where the battery is today.
+#
+# A battery is replaced the first step its SOH falls to EOL_SOH or its
+# resistance reaches RESISTANCE_EOL. Blocks of batteries × scenarios are
+# stepped through the horizon one step at a time, so only the current state
+# and each cell's replacement step are held. The batteries × scenarios ×
+# steps tensor is never built. Blocks run in a process pool with seeds
+# spawned from one SeedSequence, so results do not depend on the number of
+# workers. Each block is folded in as soon as it finishes: its per-battery
+# results go to their rows and its replacement counts are added to the fleet
+# totals, an integer sum that does not depend on the order blocks finish in.
+
+RESISTANCE_EOL = 150  # mΩ, the top of the range health_score normalizes over
+CELLS_PER_BLOCK = 250_000  # batteries × scenarios simulated together in one job
+PERCENTILES = (10, 50, 90)
+
+INPUT_COLUMNS = ['State of Charge (SOC) (%)', 'State of Health (SOH) (%)', 'Cycle Count',
+                 'Temperature (°C)', 'Internal Resistance (mΩ)']
+
+
+# Decay rates consistent with the current reading: SOH = 100 - rate * cycles ± SOH_NOISE.
+# Batteries at the SOH floor were clipped, so only a lower bound on their rate is known.
+def _decay_bounds(soh, cycles):
+    low, high = DataSet.DECAY_RATE_RANGE
+    noise = DataSet.SOH_NOISE
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lo = np.maximum((100 - soh - noise) / cycles, low)
+        hi = np.where(soh <= DataSet.SOH_RANGE[0], high, np.minimum((100 - soh + noise) / cycles, high))
+    unknown = ~(lo < hi)
+    return np.where(unknown, low, lo), np.where(unknown, high, hi)
+
+
+def _simulate_block(job):
+    columns, scenarios, steps, step_days, seed_seq, percentiles = job
+    rng = np.random.default_rng(seed_seq)
+    soc, soh0, cycles0, temp0, resistance0 = (columns[c][:, None] for c in INPUT_COLUMNS)
+    shape = (len(soh0), scenarios)
+
+    lo, hi = _decay_bounds(soh0, cycles0)
+    decay = lo + (hi - lo) * rng.random(shape)
+    growth = rng.uniform(*DataSet.RESISTANCE_GROWTH_RANGE, shape)
+    # Temperature- and health-free resistance today; growth is added on top of it
+    aged = resistance0 / (DataSet.resistance_temperature_factor(temp0) * DataSet.resistance_soh_factor(soh0))
+    soc_flat = np.broadcast_to(soc, shape).ravel()
+
+    # Step at which each cell is replaced; batteries already past end of life go at step 0
+    never = steps + 1
+    due_now = (soh0 <= EOL_SOH) | (resistance0 >= RESISTANCE_EOL)
+    replaced = np.broadcast_to(np.where(due_now, 0, never), shape).astype(np.int32)
+    used = np.zeros(shape)
+    # Poisson usage through its normal approximation (mean cycles per step is
+    # in the tens), which is an order of magnitude cheaper to draw
+    mean_cycles = step_days * CYCLES_PER_DAY
+    for step in range(1, steps + 1):
+        active = replaced == never
+        if not active.any():
+            break
+        used += np.maximum(mean_cycles + np.sqrt(mean_cycles) * rng.standard_normal(shape), 0)
+        soh = soh0 - decay * used
+        temp = DataSet.temperature_around(rng, soc_flat).reshape(shape)
+        resistance = (aged + growth * used) \
+            * DataSet.resistance_temperature_factor(temp) * DataSet.resistance_soh_factor(soh)
+        replaced[active & ((soh <= EOL_SOH) | (resistance >= RESISTANCE_EOL))] = step
+
+    # Per battery: replacement step percentiles (never = beyond the horizon) and
+    # the share of scenarios replaced within it
+    quantiles = np.percentile(replaced, percentiles, axis=1, method='inverted_cdf').T.astype(np.float64)
+    quantiles[quantiles == never] = np.nan
+    within = (replaced < never).mean(axis=1)
+    # Fleet: replacements per scenario and step
+    cells = np.arange(scenarios)[None, :] * (steps + 2) + replaced
+    counts = np.bincount(cells.ravel(), minlength=scenarios * (steps + 2)).reshape(scenarios, steps + 2)
+    return quantiles, within, counts
+
+
+# Returns (per-battery DataFrame indexed like df, fleet DataFrame indexed by day)
+def simulate(df, scenarios=1000, horizon_days=15 * 360, step_days=30, seed=None, workers=None,
+             percentiles=PERCENTILES):
+    steps = horizon_days // step_days
+    columns = {c: df[c].to_numpy(dtype=np.float64) for c in INPUT_COLUMNS}
+    block = max(1, CELLS_PER_BLOCK // scenarios)
+    starts = range(0, len(df), block)
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(starts))
+    jobs = [({c: v[s:s + block] for c, v in columns.items()}, scenarios, steps, step_days, seq, percentiles)
+            for s, seq in zip(starts, seed_seqs)]
+
+    quantiles = np.empty((len(df), len(percentiles)))
+    within = np.empty(len(df))
+    counts = np.zeros((scenarios, steps + 2), dtype=np.int64)
+
+    def fold(start, result):
+        quantiles[start:start + block] = result[0]
+        within[start:start + block] = result[1]
+        counts[:] += result[2]
+
+    if workers == 1:
+        for start, job in zip(starts, jobs):
+            fold(start, _simulate_block(job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_simulate_block, job): start for start, job in zip(starts, jobs)}
+            for future in as_completed(futures):
+                fold(futures.pop(future), future.result())
+
+    per_battery = pd.DataFrame(quantiles * step_days, index=df.index,
+                               columns=[f"Replacement p{p} (days)" for p in percentiles])
+    per_battery['Replaced Within Horizon (%)'] = within * 100
+
+    counts = counts[:, :steps + 1]
+    cumulative = counts.cumsum(axis=1)
+    fleet = pd.DataFrame({'Expected Replacements': counts.mean(axis=0)},
+                         index=pd.Index(np.arange(steps + 1) * step_days, name='Day'))
+    for p, values in zip(percentiles, np.percentile(cumulative, percentiles, axis=0)):
+        fleet[f"Cumulative Replacements p{p}"] = values
+    return per_battery, fleet
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Monte Carlo forecast of battery replacement dates")
+    parser.add_argument('--input', default='DataSets/ev_battery_health_data.csv')
+    parser.add_argument('--output', default='AnalysedData/replacement_forecast.csv')
+    parser.add_argument('--fleet-output', default='AnalysedData/replacement_forecast_fleet.csv')
+    parser.add_argument('--scenarios', type=int, default=1000, help="futures simulated per battery")
+    parser.add_argument('--horizon-years', type=int, default=15)
+    parser.add_argument('--step-days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.input)
+    per_battery, fleet = simulate(df, args.scenarios, args.horizon_years * 360, args.step_days,
+                                  args.seed, args.workers)
+    if 'Battery' in df.columns:
+        per_battery.insert(0, 'Battery', df['Battery'])
+    for path in (args.output, args.fleet_output):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    per_battery.to_csv(args.output, index=False)
+    fleet.to_csv(args.fleet_output)
+    print(f"Per-battery forecast saved to {args.output}, fleet timeline to {args.fleet_output}")
+    print(fleet.iloc[::12].round(1))
+
+
+if __name__ == '__main__':
+    main()
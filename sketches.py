@@ -0,0 +1,264 @@
+import json
+import os
+
+import numpy as np
+
+import metrics
+
+# Mergeable streaming sketches of the fleet distributions the plots need.
+#
+# Every sketch can be filled chunk by chunk, merged with another sketch of the
+# same kind, and saved to / loaded from JSON. Memory use is fixed by the sketch
+# parameters, not by the number of batteries, so plots can be drawn from a
+# sketch alone and sketches from separate daily runs can be merged into
+# rolling fleet-wide views.
+
+
+# Count, mean, variance, min and max, merged with Chan's parallel update
+class Moments:
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=np.inf, maximum=-np.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.merge(Moments(len(values), values.mean(), ((values - values.mean()) ** 2).sum(),
+                               values.min(), values.max()))
+        return self
+
+    def merge(self, other):
+        count = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+            self.count = count
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': float(self.minimum), 'max': float(self.maximum)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['count'], d['mean'], d['m2'], d['min'], d['max'])
+
+
+# Fixed-bin histogram; values outside [low, high) go to underflow/overflow counts
+class Histogram:
+    def __init__(self, low, high, bins, counts=None, underflow=0, overflow=0):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.underflow = underflow
+        self.overflow = overflow
+
+    @property
+    def edges(self):
+        return np.linspace(self.low, self.high, self.bins + 1)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        index = np.floor((values - self.low) * (self.bins / (self.high - self.low))).astype(np.int64)
+        self.underflow += int((index < 0).sum())
+        self.overflow += int((index >= self.bins).sum())
+        inside = index[(index >= 0) & (index < self.bins)]
+        self.counts += np.bincount(inside, minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError("can only merge histograms with the same bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    # Sum the fine bins into `bins` equal-width bins over [low, high]
+    def rebin(self, low, high, bins):
+        edges = np.linspace(low, high, bins + 1)
+        centres = (self.edges[:-1] + self.edges[1:]) / 2
+        index = np.clip(np.searchsorted(edges, centres, side='right') - 1, 0, bins - 1)
+        inside = (centres >= low) & (centres <= high)
+        return edges, np.bincount(index[inside], weights=self.counts[inside], minlength=bins)
+
+    def to_dict(self):
+        return {'low': self.low, 'high': self.high, 'bins': self.bins, 'counts': self.counts.tolist(),
+                'underflow': self.underflow, 'overflow': self.overflow}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['low'], d['high'], d['bins'], d['counts'], d['underflow'], d['overflow'])
+
+
+# Merging t-digest for quantiles. Centroids are sorted and greedily grouped so
+# that no group spans more than one unit of the k1 scale function, which keeps
+# tails (boxplot whiskers) accurate and caps the size near `compression`.
+class TDigest:
+    def __init__(self, compression=200, means=None, weights=None):
+        self.compression = compression
+        self.means = np.zeros(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.zeros(0) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        return self._absorb(values, np.ones(len(values)))
+
+    def merge(self, other):
+        return self._absorb(other.means, other.weights)
+
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        if len(means) == 0:
+            return self
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression * (np.arcsin(2 * q - 1) / np.pi + 0.5)
+        cluster = np.floor(k).astype(np.int64)
+        _, cluster = np.unique(cluster, return_inverse=True)
+
+        w = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / w
+        self.weights = w
+        return self
+
+    def quantile(self, q):
+        if len(self.means) == 0:
+            return np.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+        positions = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return float(np.interp(q, positions, self.means))
+
+    def to_dict(self):
+        return {'compression': self.compression, 'means': self.means.tolist(), 'weights': self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['compression'], d['means'], d['weights'])
+
+
+# Every statistic the sketch-backed plots read, grouped the way the plots group
+SKETCH_COLUMNS = ['Capacity Fade (%)', 'Efficiency (%)', 'Temp Range',
+                  'Temperature Stress Factor', 'SOH Range']
+
+
+class FleetSketch:
+    def __init__(self):
+        self.capacity_fade = Histogram(-10, 60, 700)
+        self.capacity_fade_moments = Moments()
+        self.efficiency = {label: Histogram(0, 100, 1000) for label in metrics.TEMP_LABELS}
+        self.efficiency_moments = {label: Moments() for label in metrics.TEMP_LABELS}
+        self.temperature_stress = {label: TDigest() for label in metrics.SOH_LABELS}
+        self.temperature_stress_moments = {label: Moments() for label in metrics.SOH_LABELS}
+
+    # Fill from an analysed chunk; missing band columns are derived on the fly
+    def update(self, df):
+        df = metrics.compute(df, [c for c in SKETCH_COLUMNS if metrics.available(c, df.columns)])
+        if 'Capacity Fade (%)' in df.columns:
+            self.capacity_fade.add(df['Capacity Fade (%)'])
+            self.capacity_fade_moments.add(df['Capacity Fade (%)'])
+        if 'Efficiency (%)' in df.columns and 'Temp Range' in df.columns:
+            for label, values in df.groupby('Temp Range', observed=True)['Efficiency (%)']:
+                self.efficiency[label].add(values)
+                self.efficiency_moments[label].add(values)
+        if 'Temperature Stress Factor' in df.columns and 'SOH Range' in df.columns:
+            for label, values in df.groupby('SOH Range', observed=True)['Temperature Stress Factor']:
+                self.temperature_stress[label].add(values)
+                self.temperature_stress_moments[label].add(values)
+        return self
+
+    def merge(self, other):
+        self.capacity_fade.merge(other.capacity_fade)
+        self.capacity_fade_moments.merge(other.capacity_fade_moments)
+        for label in metrics.TEMP_LABELS:
+            self.efficiency[label].merge(other.efficiency[label])
+            self.efficiency_moments[label].merge(other.efficiency_moments[label])
+        for label in metrics.SOH_LABELS:
+            self.temperature_stress[label].merge(other.temperature_stress[label])
+            self.temperature_stress_moments[label].merge(other.temperature_stress_moments[label])
+        return self
+
+    def to_dict(self):
+        return {
+            'capacity_fade': self.capacity_fade.to_dict(),
+            'capacity_fade_moments': self.capacity_fade_moments.to_dict(),
+            'efficiency': {k: v.to_dict() for k, v in self.efficiency.items()},
+            'efficiency_moments': {k: v.to_dict() for k, v in self.efficiency_moments.items()},
+            'temperature_stress': {k: v.to_dict() for k, v in self.temperature_stress.items()},
+            'temperature_stress_moments': {k: v.to_dict() for k, v in self.temperature_stress_moments.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls()
+        sketch.capacity_fade = Histogram.from_dict(d['capacity_fade'])
+        sketch.capacity_fade_moments = Moments.from_dict(d['capacity_fade_moments'])
+        sketch.efficiency = {k: Histogram.from_dict(v) for k, v in d['efficiency'].items()}
+        sketch.efficiency_moments = {k: Moments.from_dict(v) for k, v in d['efficiency_moments'].items()}
+        sketch.temperature_stress = {k: TDigest.from_dict(v) for k, v in d['temperature_stress'].items()}
+        sketch.temperature_stress_moments = {k: Moments.from_dict(v)
+                                             for k, v in d['temperature_stress_moments'].items()}
+        return sketch
+
+    def save(self, file_path):
+        with open(file_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(file_path + '.tmp', file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+# Sketches are persisted next to the analysed output they describe
+def sketch_path(output_path):
+    root, _ = os.path.splitext(str(output_path))
+    return f"{root}.sketch.json"
+
+
+# Merge several persisted sketches (e.g. the last 30 daily runs) into one
+def merge_sketch_files(paths):
+    merged = FleetSketch()
+    for path in paths:
+        merged.merge(FleetSketch.load(path))
+    return merged
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge fleet sketches from separate runs")
+    parser.add_argument('sketches', nargs='+')
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args(argv)
+
+    merge_sketch_files(args.sketches).save(args.out)
+    print(f"Merged {len(args.sketches)} sketches into {args.out}")
+
+
+if __name__ == '__main__':
+    main()
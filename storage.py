@@ -0,0 +1,454 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import metrics
+
+# Columnar (Parquet) storage for the raw and analysed datasets.
+#
+# Every known column has an explicit dtype so nothing is re-inferred on load.
+# The formatted "Life Span Remaining" string is stored as a numeric
+# "Life Span Remaining (days)" column, and low-cardinality text columns are
+# categorical. CSV stays available as an export format. Parquet needs pyarrow.
+
+LIFE_SPAN_DAYS = metrics.LIFE_SPAN_DAYS
+
+RAW_SCHEMA = {
+    'Battery': 'string',
+    'Battery Model': 'category',
+    'State of Charge (SOC) (%)': 'float64',
+    'State of Health (SOH) (%)': 'float64',
+    'Cycle Count': 'int64',
+    'Initial Rated Capacity (Ah)': 'float64',
+    'Full Charge Capacity (Ah)': 'float64',
+    'Voltage (V)': 'float64',
+    'Temperature (°C)': 'float64',
+    'Internal Resistance (mΩ)': 'float64',
+}
+
+ANALYSED_SCHEMA = dict(RAW_SCHEMA, **{
+    'Efficiency (%)': 'float64',
+    LIFE_SPAN_DAYS: 'int32',
+    'Charging/Discharging Rate': 'category',
+    'Temperature Stress Factor': 'int64',
+    'Voltage Stability Rating': 'int64',
+    'Battery Health Score': 'int64',
+    'Capacity Fade (%)': 'float64',
+    'Health Status': 'category',
+})
+
+# Compact in-memory layout for very large fleets: integer battery IDs, float32
+# sensor readings and the smallest integer type each derived rating fits in.
+# "Battery N" labels become the integer N; any other labels stay in a
+# categorical 'Battery' column. Derived float metrics
+# stay float64 so analysed values survive the round trip unchanged, and the
+# float32 readings are widened back to their recorded decimals
+# (metrics.SENSOR_DECIMALS) on the way out. Integer columns whose values do not
+# fit the compact type keep their wider type.
+BATTERY_ID = 'Battery ID'
+BATTERY_PREFIX = 'Battery '
+
+COMPACT_SCHEMA = {
+    BATTERY_ID: 'int32',
+    'Battery Model': 'category',
+    'State of Charge (SOC) (%)': 'float32',
+    'State of Health (SOH) (%)': 'float32',
+    'Cycle Count': 'int16',
+    'Initial Rated Capacity (Ah)': 'float32',
+    'Full Charge Capacity (Ah)': 'float32',
+    'Voltage (V)': 'float32',
+    'Temperature (°C)': 'float32',
+    'Internal Resistance (mΩ)': 'float32',
+    'Efficiency (%)': 'float64',
+    LIFE_SPAN_DAYS: 'int16',
+    'Life Span Years': 'int8',
+    'Charging/Discharging Rate': 'category',
+    'Temperature Stress Factor': 'uint8',
+    'Voltage Stability Rating': 'int8',
+    'Battery Health Score': 'uint8',
+    'Capacity Fade (%)': 'float64',
+    'Health Status': 'category',
+    'SOH Range': 'category',
+    'Temp Range': 'category',
+}
+
+# Rows per Parquet row group; min/max statistics are kept per group so filters
+# can skip whole groups without decoding them
+ROW_GROUP_SIZE = 100_000
+
+# Binary sidecars for CSV inputs. The first cached load parses the whole CSV
+# once and writes the typed columns as an uncompressed Arrow IPC file in a
+# .cache directory next to it; later loads memory-map that file and select the
+# wanted columns without parsing any text. A sidecar records the source's size,
+# mtime and SHA-256: another size rebuilds it, and another mtime re-hashes the
+# source, so a touched but unchanged file keeps its sidecar.
+CACHE_DIR = '.cache'
+
+
+# Convert an analysed or raw DataFrame to the typed columnar layout
+def to_columnar(df):
+    df = df.copy()
+    if 'Life Span Remaining' in df.columns:
+        position = df.columns.get_loc('Life Span Remaining')
+        days = metrics.parse_life_span(df.pop('Life Span Remaining'))
+        df.insert(position, LIFE_SPAN_DAYS, days)
+    return df.astype({c: t for c, t in ANALYSED_SCHEMA.items() if c in df.columns})
+
+
+# Undo to_columnar: bring back the formatted life span string for CSV export
+def from_columnar(df):
+    df = df.copy()
+    if LIFE_SPAN_DAYS in df.columns:
+        position = df.columns.get_loc(LIFE_SPAN_DAYS)
+        text = metrics.format_life_span(df.pop(LIFE_SPAN_DAYS).astype('int64'))
+        df.insert(position, 'Life Span Remaining', text)
+    return df
+
+
+# "Battery <id>" labels -> integer ids, or None when any label has another form
+# (or the labels are not text at all)
+def encode_batteries(labels):
+    labels = pd.Series(labels).reset_index(drop=True)
+    if isinstance(labels.dtype, pd.CategoricalDtype):
+        labels = labels.astype(object)
+    if not pd.api.types.is_string_dtype(labels):
+        return None
+    pattern = BATTERY_PREFIX + r'(?:0|[1-9]\d{0,8})'
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        if not labels.str.fullmatch(pattern).all():
+            return None
+        return labels.str.slice(len(BATTERY_PREFIX)).astype(np.int64).to_numpy()
+
+    # pyarrow's string kernels are several times faster than pandas' .str methods
+    try:
+        array = pa.array(labels, type=pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+    if array.null_count or not pc.all(pc.match_substring_regex(array, f"^{pattern}$")).as_py():
+        return None
+    digits = pc.utf8_slice_codeunits(array, len(BATTERY_PREFIX))
+    return pc.cast(digits, pa.int64()).to_numpy(zero_copy_only=False)
+
+
+def decode_batteries(ids):
+    return BATTERY_PREFIX + pd.Series(np.asarray(ids)).astype(str)
+
+
+# Narrow each known column to its COMPACT_SCHEMA type
+def to_compact(df):
+    df = to_columnar(df)
+    ids = encode_batteries(df['Battery']) if 'Battery' in df.columns else None
+    if ids is not None:
+        df.insert(df.columns.get_loc('Battery'), BATTERY_ID, ids)
+        del df['Battery']
+    return narrow(df)
+
+
+# Narrow the columns of an already compact frame (metrics added to it, say) to
+# their COMPACT_SCHEMA types; columns that already have them are left alone
+def narrow(df):
+    types = {}
+    for column, dtype in COMPACT_SCHEMA.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype != 'category' and np.dtype(dtype).kind in 'iu' and len(df):
+            info = np.iinfo(dtype)
+            if df[column].min() < info.min or df[column].max() > info.max:
+                continue
+        types[column] = dtype
+    if 'Battery' in df.columns and df['Battery'].dtype != 'category':
+        types['Battery'] = 'category'
+    return df.astype(types) if types else df
+
+
+# True for frames in the to_compact layout
+def is_compact(df):
+    return BATTERY_ID in df.columns or any(df[c].dtype == np.float32 for c in metrics.SENSOR_DECIMALS
+                                           if c in df.columns)
+
+
+# Undo to_compact: battery labels and the usual ANALYSED_SCHEMA types
+def from_compact(df):
+    df = df.copy()
+    if BATTERY_ID in df.columns:
+        position = df.columns.get_loc(BATTERY_ID)
+        df.insert(position, 'Battery', decode_batteries(df.pop(BATTERY_ID)).set_axis(df.index))
+    for column in df.columns:
+        df[column] = metrics.widen(df[column])
+    return df.astype({c: t for c, t in ANALYSED_SCHEMA.items() if c in df.columns})
+
+
+# Concatenate compact chunks. Chunks with other labels kept them as categories;
+# once any chunk has, every chunk's labels are merged into one categorical.
+def concat_compact(chunks):
+    frames = list(chunks)
+    if not frames:
+        return pd.DataFrame()
+    if any('Battery' in f.columns for f in frames):
+        labels = union_categoricals([f['Battery'].array if 'Battery' in f.columns
+                                     else pd.Categorical(decode_batteries(f[BATTERY_ID]).astype('string'))
+                                     for f in frames])
+        for i, f in enumerate(frames):
+            if BATTERY_ID in f.columns:
+                f = frames[i] = f.copy()
+                f.insert(f.columns.get_loc(BATTERY_ID), 'Battery', 0)
+                del f[BATTERY_ID]
+        df = pd.concat(frames, ignore_index=True)
+        df['Battery'] = labels
+        return df
+    return pd.concat(frames, ignore_index=True)
+
+
+# Write one row group at a time; a compact frame is widened a slice at a time,
+# so the full-width frame is never held in memory next to it
+def save_dataset(df, file_path, row_group_size=ROW_GROUP_SIZE):
+    widen = from_compact if is_compact(df) else (lambda chunk: chunk)
+    slices = (widen(df.iloc[start:start + row_group_size])
+              for start in range(0, max(len(df), 1), row_group_size))
+    if str(file_path).endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in slices:
+                table = pa.Table.from_pandas(to_columnar(chunk), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(file_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for i, chunk in enumerate(slices):
+                from_columnar(chunk).to_csv(f, index=False, header=(i == 0))
+
+
+# Load a dataset, reading only `columns` (all if None). `filters` follows the
+# pyarrow convention, e.g. [('Cycle Count', '>', 1500), ('Health Status', '==', 'Poor')];
+# for Parquet it is pushed down to skip row groups, for CSV it is applied after parsing.
+# compact=True returns the to_compact layout, converting a chunk at a time so
+# the full-width frame never has to fit in memory. cache=True reads CSV files
+# through their binary sidecar (see CACHE_DIR).
+def load_dataset(file_path, columns=None, filters=None, compact=False, chunk_size=250_000, cache=False):
+    if compact:
+        if str(file_path).endswith('.parquet'):
+            import pyarrow.parquet as pq
+
+            batches = pq.ParquetFile(file_path).iter_batches(chunk_size, columns=columns)
+            chunks = (to_compact(batch.to_pandas()) for batch in batches)
+        else:
+            usecols = None if columns is None else \
+                ['Life Span Remaining' if c == LIFE_SPAN_DAYS else c for c in columns]
+            reader = pd.read_csv(file_path, usecols=usecols, chunksize=chunk_size, float_precision='round_trip')
+            chunks = (to_compact(chunk) for chunk in reader)
+        df = concat_compact(chunks)
+        if filters:
+            df = df[_filter_mask(df, filters)].reset_index(drop=True)
+        return df
+
+    if str(file_path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(file_path, columns=columns, filters=filters)
+        return table.to_pandas()
+
+    needed = None
+    if columns is not None:
+        needed = list(columns) + [c for c, _, _ in filters or [] if c not in columns]
+    if cache:
+        df = load_csv_cached(file_path, needed)
+    else:
+        # CSV files still carry the life span as a string, so translate a request for the days column
+        usecols = None if needed is None else ['Life Span Remaining' if c == LIFE_SPAN_DAYS else c for c in needed]
+        df = read_csv(file_path, usecols)
+    if filters:
+        df = df[_filter_mask(df, filters)].reset_index(drop=True)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def _filter_mask(df, filters):
+    ops = {
+        '==': lambda s, v: s == v,
+        '=': lambda s, v: s == v,
+        '!=': lambda s, v: s != v,
+        '<': lambda s, v: s < v,
+        '<=': lambda s, v: s <= v,
+        '>': lambda s, v: s > v,
+        '>=': lambda s, v: s >= v,
+        'in': lambda s, v: s.isin(v),
+        'not in': lambda s, v: ~s.isin(v),
+    }
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= ops[op](df[column], value)
+    return mask
+
+
+# Column store: one .npy file per column in a directory, opened with
+# np.load(mmap_mode='r') so several processes can share one copy of the data
+# through the page cache. "Battery N" labels are stored as the integer N, so
+# columns.json does not grow with the fleet. Other text and categorical
+# columns are stored as integer codes with their categories listed in columns.json.
+def write_column_store(df, directory):
+    os.makedirs(directory, exist_ok=True)
+    meta = {}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        name = f"col{i:03d}.npy"
+        ids = encode_batteries(values) if column == 'Battery' else None
+        if ids is not None:
+            np.save(os.path.join(directory, name), ids)
+            meta[column] = {'file': name, 'prefix': BATTERY_PREFIX}
+        elif isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(values):
+            values = values.astype('category')
+            np.save(os.path.join(directory, name), values.cat.codes.to_numpy())
+            meta[column] = {'file': name, 'categories': values.cat.categories.tolist(),
+                            'ordered': bool(values.cat.ordered)}
+        else:
+            np.save(os.path.join(directory, name), values.to_numpy())
+            meta[column] = {'file': name}
+    with open(os.path.join(directory, 'columns.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+# Returns {column: array or Categorical}; numeric arrays are read-only memory maps.
+# Battery labels are rebuilt only for the rows read.
+# Passing `rows` (row positions) reads only those rows.
+def read_column_store(directory, columns=None, rows=None):
+    with open(os.path.join(directory, 'columns.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    result = {}
+    for column in columns or meta:
+        entry = meta[column]
+        values = np.load(os.path.join(directory, entry['file']), mmap_mode='r')
+        if rows is not None:
+            values = values[rows]
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, entry['categories'], ordered=entry['ordered'])
+        elif 'prefix' in entry:
+            values = decode_batteries(values).to_numpy()
+        result[column] = values
+    return result
+
+
+# Typed CSV parse with no dtype inference. pyarrow's reader is multithreaded and,
+# like the C parser's round_trip mode, gives back exactly the floats that were written.
+def read_csv(file_path, usecols=None):
+    header = usecols or pd.read_csv(file_path, nrows=0).columns
+    dtype = {c: t for c, t in ANALYSED_SCHEMA.items() if c in header}
+    if 'Life Span Remaining' in header:
+        dtype['Life Span Remaining'] = 'string'
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return to_columnar(pd.read_csv(file_path, usecols=usecols, dtype=dtype, float_precision='round_trip'))
+    return to_columnar(pd.read_csv(file_path, usecols=usecols, dtype=dtype, engine='pyarrow'))
+
+
+def file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(file_path):
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, CACHE_DIR, name + '.arrow')
+
+
+# Columns a dataset holds, under the names load_dataset returns them with
+def dataset_columns(file_path):
+    if str(file_path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(file_path).names
+    header = pd.read_csv(file_path, nrows=0).columns
+    return [LIFE_SPAN_DAYS if c == 'Life Span Remaining' else c for c in header]
+
+
+# Load a CSV through its sidecar, building or refreshing the sidecar as needed.
+# Sidecars are Arrow files, so without pyarrow the CSV is simply parsed.
+def load_csv_cached(file_path, columns=None):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        usecols = None if columns is None else ['Life Span Remaining' if c == LIFE_SPAN_DAYS else c for c in columns]
+        df = read_csv(file_path, usecols)
+        return df if columns is None else df[columns]
+
+    path = cache_path(file_path)
+    stat = os.stat(file_path)
+    stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        saved = json.loads(table.schema.metadata[b'source'])
+    except (OSError, KeyError, ValueError, pa.ArrowInvalid):
+        table = saved = None
+
+    if saved is not None and saved['size'] == stamp['size']:
+        if saved['mtime_ns'] == stamp['mtime_ns']:
+            return _select(table, columns)
+        if saved['sha256'] == file_hash(file_path):
+            _write_sidecar(path, table, dict(saved, **stamp))
+            return _select(table, columns)
+
+    stamp['sha256'] = file_hash(file_path)
+    df = read_csv(file_path)
+    _write_sidecar(path, pa.Table.from_pandas(df, preserve_index=False), stamp)
+    return df if columns is None else df[columns]
+
+
+# Numeric columns come back as read-only views of the memory map; text columns
+# are still converted to Python strings
+def _select(table, columns):
+    table = table if columns is None else table.select(columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _write_sidecar(path, table, stamp):
+    import pyarrow as pa
+
+    # Arrow metadata keys are bytes; a str key would sit next to the old b'source' instead of replacing it
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'source'] = json.dumps(stamp).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with pa.OSFile(path + '.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        # A read-only data directory just means no sidecar
+        pass
+
+
+# Convert between formats, e.g. python storage.py AnalysedData/x.csv AnalysedData/x.parquet
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a battery dataset between CSV and Parquet")
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    args = parser.parse_args(argv)
+
+    df = load_dataset(args.source)
+    save_dataset(df, args.destination)
+    print(f"Saved {len(df)} rows to {args.destination}")
+
+
+if __name__ == '__main__':
+    main()
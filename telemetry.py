@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import storage
+
+# Append-only time-series store for repeated readings per battery.
+#
+# Layout of a store directory:
+#   log/<column>.bin      raw readings in arrival order, appended with tofile()
+#   sorted-N/<column>.npy readings grouped by battery (compaction generation N)
+#   sorted-N/index.npz    battery ids plus start/stop offsets into the sorted columns
+#   meta.json             committed row counts and the current generation
+#
+# Readers only trust the row counts in meta.json, so a crash halfway through an
+# append leaves the committed data intact. compact() folds the log into a new
+# sorted generation; after that a battery's history is a zero-copy memmap slice.
+
+COLUMNS = {
+    'battery': np.int64,
+    'timestamp': np.int64,
+    'soc': np.float32,
+    'voltage': np.float32,
+    'temperature': np.float32,
+    'resistance': np.float32,
+    'cycle_count': np.int32,
+}
+
+# Battery column names used by the rest of the project
+FRAME_COLUMNS = {
+    'soc': 'State of Charge (SOC) (%)',
+    'voltage': 'Voltage (V)',
+    'temperature': 'Temperature (°C)',
+    'resistance': 'Internal Resistance (mΩ)',
+    'cycle_count': 'Cycle Count',
+}
+
+# Rolling standard deviation of the voltage residual (V) at which the stability
+# rating drops each point: below 10 mV is a 10, 90 mV and above is a 1
+STABILITY_STD_BINS = [0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.07, 0.08, 0.09]
+
+
+# "Battery 42" -> 42
+def battery_id(label):
+    return int(str(label).rsplit(' ', 1)[-1])
+
+
+# battery_id of a whole column of labels as an int64 array
+def battery_ids(labels):
+    ids = storage.encode_batteries(labels)
+    if ids is None:
+        # Labels in another form, e.g. already numeric
+        ids = pd.Series(labels).map(battery_id).to_numpy(dtype=np.int64)
+    return ids
+
+
+class TelemetryStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'log'), exist_ok=True)
+        self._meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding='utf-8') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'log_rows': 0, 'sorted_rows': 0, 'generation': 0}
+            self._save_meta()
+        self._sorted = None
+        self._log_index = None
+
+    def _save_meta(self):
+        with open(self._meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(self._meta_path + '.tmp', self._meta_path)
+
+    def _log_file(self, column):
+        return os.path.join(self.directory, 'log', f"{column}.bin")
+
+    def _sorted_dir(self, generation=None):
+        generation = self.meta['generation'] if generation is None else generation
+        return os.path.join(self.directory, f"sorted-{generation}")
+
+    def __len__(self):
+        return self.meta['log_rows'] + self.meta['sorted_rows']
+
+    # Append a batch of readings given as {column: array} (all COLUMNS required)
+    def append(self, readings):
+        n = len(readings['battery'])
+        rows = self.meta['log_rows']
+        for column, dtype in COLUMNS.items():
+            values = np.ascontiguousarray(readings[column], dtype=dtype)
+            if len(values) != n:
+                raise ValueError(f"column '{column}' has {len(values)} values, expected {n}")
+            path = self._log_file(column)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                # Overwrite anything left behind by an append that never committed
+                f.seek(rows * np.dtype(dtype).itemsize)
+                values.tofile(f)
+                f.truncate()
+        self.meta['log_rows'] = rows + n
+        self._save_meta()
+        self._log_index = None
+
+    # Append readings from a DataFrame using the project's column names
+    def append_frame(self, df, timestamp):
+        readings = {'battery': battery_ids(df['Battery']),
+                    'timestamp': np.broadcast_to(np.asarray(timestamp, dtype=np.int64), (len(df),))}
+        for column, name in FRAME_COLUMNS.items():
+            readings[column] = df[name].to_numpy()
+        self.append(readings)
+
+    def _log_column(self, column):
+        rows = self.meta['log_rows']
+        if rows == 0:
+            return np.zeros(0, dtype=COLUMNS[column])
+        return np.memmap(self._log_file(column), dtype=COLUMNS[column], mode='r', shape=(rows,))
+
+    def _load_sorted(self):
+        if self._sorted is None:
+            if self.meta['sorted_rows'] == 0:
+                self._sorted = ({}, np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64))
+            else:
+                directory = self._sorted_dir()
+                columns = {c: np.load(os.path.join(directory, f"{c}.npy"), mmap_mode='r') for c in COLUMNS}
+                index = np.load(os.path.join(directory, 'index.npz'))
+                self._sorted = (columns, index['battery'], index['start'], index['stop'])
+        return self._sorted
+
+    # Positions of each battery's readings in the (small, uncompacted) log
+    def _log_positions(self, battery):
+        if self._log_index is None:
+            batteries = np.asarray(self._log_column('battery'))
+            order = np.argsort(batteries, kind='stable')
+            self._log_index = (batteries[order], order)
+        keys, order = self._log_index
+        lo, hi = np.searchsorted(keys, [battery, battery + 1])
+        return np.sort(order[lo:hi])
+
+    # Full history of one battery in arrival order, as {column: array}. The
+    # compacted part is a read-only memmap view; readings still in the log are appended.
+    def history(self, battery):
+        columns, ids, starts, stops = self._load_sorted()
+        i = np.searchsorted(ids, battery)
+        found = i < len(ids) and ids[i] == battery
+        positions = self._log_positions(battery)
+
+        result = {}
+        for column in COLUMNS:
+            part = columns[column][starts[i]:stops[i]] if found else np.zeros(0, COLUMNS[column])
+            if len(positions):
+                part = np.concatenate([part, self._log_column(column)[positions]])
+            result[column] = part
+        return result
+
+    # Fold the log into a new sorted generation, grouped by battery with arrival
+    # order kept inside each battery
+    def compact(self):
+        columns, _, _, _ = self._load_sorted()
+        merged = {}
+        for column in COLUMNS:
+            old = np.asarray(columns[column]) if columns else np.zeros(0, COLUMNS[column])
+            merged[column] = np.concatenate([old, np.asarray(self._log_column(column))])
+        order = np.argsort(merged['battery'], kind='stable')
+
+        generation = self.meta['generation'] + 1
+        directory = self._sorted_dir(generation)
+        os.makedirs(directory, exist_ok=True)
+        for column in COLUMNS:
+            np.save(os.path.join(directory, f"{column}.npy"), merged[column][order])
+        ids, starts, counts = np.unique(merged['battery'][order], return_index=True, return_counts=True)
+        np.savez(os.path.join(directory, 'index.npz'), battery=ids, start=starts, stop=starts + counts)
+
+        previous = self._sorted_dir()
+        self.meta = {'log_rows': 0, 'sorted_rows': len(order), 'generation': generation}
+        self._save_meta()
+        self._sorted = None
+        self._log_index = None
+        for column in COLUMNS:
+            if os.path.exists(self._log_file(column)):
+                os.remove(self._log_file(column))
+        if os.path.isdir(previous):
+            shutil.rmtree(previous)
+
+    # Voltage Stability Rating of every battery in the store, from the rolling
+    # standard deviation of the voltage residual over its last `window` readings
+    def voltage_stability(self, window=20):
+        columns, ids, starts, stops = self._load_sorted()
+        voltage = np.asarray(columns['voltage']) if columns else np.zeros(0, np.float32)
+        soc = np.asarray(columns['soc']) if columns else np.zeros(0, np.float32)
+        if self.meta['log_rows']:
+            # Only the last `window` compacted readings of a battery can fall in its
+            # window, so those are regrouped with the log rather than the whole store
+            first = np.maximum(starts, stops - window)
+            lengths = stops - first
+            offsets = np.cumsum(lengths) - lengths
+            tail = np.arange(lengths.sum()) - np.repeat(offsets - first, lengths)
+            battery = np.concatenate([np.repeat(ids, lengths), self._log_column('battery')])
+            order = np.argsort(battery, kind='stable')
+            voltage = np.concatenate([voltage[tail], self._log_column('voltage')])[order]
+            soc = np.concatenate([soc[tail], self._log_column('soc')])[order]
+            ids, starts, counts = np.unique(battery[order], return_index=True, return_counts=True)
+            stops = starts + counts
+        if len(ids) == 0:
+            return pd.Series(dtype=np.int64, name='Voltage Stability Rating')
+        residual = _voltage_residual(voltage, soc)
+
+        # Windowed sums from cumulative sums, one window per battery ending at its last reading
+        first = np.maximum(starts, stops - window)
+        csum = np.concatenate([[0.0], np.cumsum(residual)])
+        csq = np.concatenate([[0.0], np.cumsum(residual ** 2)])
+        n = stops - first
+        mean = (csum[stops] - csum[first]) / n
+        var = np.maximum((csq[stops] - csq[first]) / n - mean ** 2, 0)
+        rating = 10 - np.digitize(np.sqrt(var), STABILITY_STD_BINS)
+        return pd.Series(rating, index=ids, name='Voltage Stability Rating')
+
+
+# Deviation of the measured voltage from the linear SOC model used by metrics.voltage_stability
+def _voltage_residual(voltage, soc):
+    return voltage.astype(np.float64) - (3.2 + (soc.astype(np.float64) / 100) * 1.0)
+
+
+# Rolling standard deviation of the voltage residual over one battery's history
+def rolling_voltage_std(history, window=20):
+    residual = pd.Series(_voltage_residual(history['voltage'], history['soc']))
+    return residual.rolling(window, min_periods=2).std(ddof=0).to_numpy()
+
+
+# Rating per reading of one battery's history, on the same 1-10 scale as the snapshot metric
+def rolling_voltage_stability(history, window=20):
+    std = np.nan_to_num(rolling_voltage_std(history, window))
+    return 10 - np.digitize(std, STABILITY_STD_BINS)
+
+
+# Replace the snapshot Voltage Stability Rating in an analysed frame with the
+# history-based one wherever the store has readings for that battery
+def apply_voltage_stability(df, store, window=20):
+    df = df.copy()
+    if 'Voltage Stability Rating' not in df.columns:
+        df = metrics.compute(df, ['Voltage Stability Rating'])
+    ratings = store.voltage_stability(window)
+    from_history = pd.Series(ratings.reindex(battery_ids(df['Battery'])).to_numpy(), index=df.index)
+    df['Voltage Stability Rating'] = from_history.fillna(df['Voltage Stability Rating']).astype(np.int64)
+    # The health score is weighted on the rating, so it has to follow
+    if 'Battery Health Score' in df.columns:
+        df['Battery Health Score'] = metrics.health_score(df)
+    return df
@@ -0,0 +1,27 @@
+import shutil
+
+import pytest
+
+import analysis
+import batch
+import storage
+from DataSet import generate_battery_data
+
+
+@pytest.mark.parametrize('module', [analysis, storage])
+def test_code_changes_invalidate_results(tmp_path, monkeypatch, module):
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    generate_battery_data(100, seed=0).to_csv(inputs / 'fleet.csv', index=False)
+    out_dir = str(tmp_path / 'out')
+
+    assert len(batch.analyse_batch(str(inputs), out_dir, workers=1)['analysed']) == 1
+    assert len(batch.analyse_batch(str(inputs), out_dir, workers=1)['skipped']) == 1
+
+    # Not just the metric definitions: an edit to how results are computed or written counts
+    source = tmp_path / 'module.py'
+    shutil.copy(module.__file__, source)
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write('\n# edited\n')
+    monkeypatch.setattr(module, '__file__', str(source))
+    assert len(batch.analyse_batch(str(inputs), out_dir, workers=1)['analysed']) == 1
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import bench
+
+
+def test_dead_worker_is_reported_not_waited_on():
+    # A worker that exits without answering, as one killed for using too much memory does
+    with pytest.raises(RuntimeError, match='worker died with exit code 137'):
+        bench._call_in_process(os._exit, (137,), timeout=60)
+
+
+def test_worker_exception_is_reported():
+    with pytest.raises(RuntimeError, match='^ValueError:'):
+        bench._call_in_process(int, ('not a number',), timeout=60)
+
+
+def test_slow_case_is_killed_after_timeout():
+    result = bench.run_case('generate', 1000, timeout=0.01)
+    assert result['status'] == 'failed'
+    assert 'timed out' in result['reason']
+
+
+def test_case_runs():
+    result = bench.run_case('generate', 1000, timeout=120)
+    assert result['status'] == 'ok' and result['rows'] == 1000
@@ -0,0 +1,61 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import analysis
+import storage
+from DataSet import generate_battery_data
+
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    path = tmp_path / 'raw.csv'
+    generate_battery_data(1000, seed=41).to_csv(path, index=False)
+    return path
+
+
+def reader_threads():
+    return [t for t in threading.enumerate() if t.name == 'analysis-read-ahead']
+
+
+def test_chunked_csv_matches_whole_file(raw_csv, tmp_path):
+    whole = tmp_path / 'whole.csv'
+    storage.save_dataset(analysis.analyse(pd.read_csv(raw_csv)), whole)
+    chunked = tmp_path / 'chunked.csv'
+    assert analysis.analyse_csv_chunked(raw_csv, chunked, chunk_size=130) == 1000
+    assert chunked.read_bytes() == whole.read_bytes()
+
+
+def test_chunked_parquet_matches_whole_file(raw_csv, tmp_path):
+    whole = tmp_path / 'whole.parquet'
+    storage.save_dataset(analysis.analyse(pd.read_csv(raw_csv)), whole)
+    chunked = tmp_path / 'chunked.parquet'
+    analysis.analyse_csv_chunked(raw_csv, chunked, chunk_size=130, parity=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(chunked), pd.read_parquet(whole))
+
+
+def test_reader_stops_when_analysis_fails(raw_csv, tmp_path, monkeypatch):
+    analyse = analysis.analyse
+    calls = []
+
+    def failing(chunk):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise RuntimeError('boom')
+        return analyse(chunk)
+
+    monkeypatch.setattr(analysis, 'analyse', failing)
+    with pytest.raises(RuntimeError, match='boom'):
+        analysis.analyse_csv_chunked(raw_csv, tmp_path / 'out.csv', chunk_size=50)
+    assert reader_threads() == []
+
+
+def test_parse_errors_reach_the_caller(tmp_path):
+    path = tmp_path / 'broken.csv'
+    lines = generate_battery_data(300, seed=42).to_csv(index=False).splitlines()
+    lines[250] += ',1,2,3'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    with pytest.raises(pd.errors.ParserError):
+        analysis.analyse_csv_chunked(path, tmp_path / 'out.csv', chunk_size=40)
+    assert reader_threads() == []
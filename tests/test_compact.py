@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+import analysis
+import storage
+from DataSet import generate_battery_data
+
+
+def compact_fleet(rows=2000, seed=7):
+    return storage.to_compact(generate_battery_data(rows, seed=seed))
+
+
+def test_analyse_keeps_compact_dtypes():
+    df = analysis.analyse(compact_fleet())
+    assert 'Life Span Remaining' not in df.columns
+    for column, dtype in storage.COMPACT_SCHEMA.items():
+        if column in df.columns:
+            assert df[column].dtype == dtype, column
+    assert df['Voltage (V)'].dtype == np.float32
+
+
+def test_analyse_does_not_copy_the_compact_input():
+    compact = compact_fleet()
+    df = analysis.analyse(compact)
+    assert np.shares_memory(df['Voltage (V)'].to_numpy(), compact['Voltage (V)'].to_numpy())
+
+
+def test_save_compact_in_slices_matches_full_width(tmp_path):
+    raw = generate_battery_data(2500, seed=8)
+    full = analysis.analyse(raw)
+    compact = analysis.analyse(storage.to_compact(raw))
+    for name in ('out.csv', 'out.parquet'):
+        storage.save_dataset(full, tmp_path / f"full-{name}")
+        storage.save_dataset(compact, tmp_path / f"compact-{name}", row_group_size=300)
+    assert (tmp_path / 'full-out.csv').read_bytes() == (tmp_path / 'compact-out.csv').read_bytes()
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'compact-out.parquet'),
+                                  pd.read_parquet(tmp_path / 'full-out.parquet'))
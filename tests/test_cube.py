@@ -0,0 +1,45 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import analysis
+import cube
+import metrics
+from DataSet import generate_battery_data
+
+
+def test_summary_matches_pandas():
+    df = metrics.compute(analysis.analyse(generate_battery_data(4000, seed=21)), list(cube.DIMENSIONS))
+    fleet = cube.FleetCube().update(df.iloc[:1500]).merge(cube.FleetCube().update(df.iloc[1500:]))
+    summary = fleet.summary(['Health Status'], measures=['Battery Health Score'])
+    expected = df.groupby('Health Status', observed=False)['Battery Health Score'].agg(['count', 'mean'])
+    np.testing.assert_array_equal(summary['Batteries'], expected['count'])
+    np.testing.assert_allclose(summary['Battery Health Score mean'], expected['mean'])
+
+
+def test_unknown_labels_are_counted_as_skipped():
+    df = analysis.analyse(generate_battery_data(100, seed=22))
+    df['Charging/Discharging Rate'] = df['Charging/Discharging Rate'].replace('Fast', 'Fast (2C)')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        fleet = cube.FleetCube().update(df)
+    fast = int((df['Charging/Discharging Rate'] == 'Fast (2C)').sum())
+    assert fast > 0
+    assert fleet.skipped == fast
+    assert fleet.rows.sum() == len(df) - fast
+
+
+def test_main_refuses_files_with_skipped_rows(tmp_path, capsys):
+    df = analysis.analyse(generate_battery_data(50, seed=23))
+    df['Charging/Discharging Rate'] = 'Fast (2C)'
+    path = tmp_path / 'odd.csv'
+    df.to_csv(path, index=False)
+    target = tmp_path / 'fleet.cube.npz'
+    with pytest.raises(SystemExit):
+        cube.main(['--input', str(path), '--cube', str(target)])
+    assert not target.exists()
+    assert '50 skipped' in capsys.readouterr().out
+
+    cube.main(['--input', str(path), '--cube', str(target), '--allow-skipped'])
+    assert cube.FleetCube.load(target).skipped == 50
@@ -0,0 +1,27 @@
+import hashlib
+
+import pandas as pd
+
+import DataSet
+
+
+def shard_hashes(paths):
+    return [hashlib.sha256(open(p, 'rb').read()).hexdigest() for p in paths]
+
+
+def test_shards_are_identical_for_any_worker_count(tmp_path):
+    (tmp_path / 'one').mkdir()
+    (tmp_path / 'two').mkdir()
+    one = DataSet.generate_sharded(tmp_path / 'one' / 'fleet.csv', 2500, shard_rows=700, chunk_size=300,
+                                   seed=17, workers=1)
+    two = DataSet.generate_sharded(tmp_path / 'two' / 'fleet.csv', 2500, shard_rows=700, chunk_size=300,
+                                   seed=17, workers=2)
+    assert len(one) == len(two) == 4
+    assert shard_hashes(one) == shard_hashes(two)
+
+
+def test_shards_continue_battery_ids(tmp_path):
+    parts = DataSet.generate_sharded(tmp_path / 'fleet.csv', 1000, shard_rows=300, chunk_size=120,
+                                     seed=3, workers=1)
+    df = pd.concat([pd.read_csv(p) for p in parts], ignore_index=True)
+    assert df['Battery'].tolist() == [f"Battery {i}" for i in range(1, 1001)]
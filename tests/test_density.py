@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import analysis
+import density
+import metrics
+from DataSet import generate_battery_data
+
+# The binned estimate must stay within this much of the exact KDE, relative to
+# the peak density (the tolerance stated in density.py)
+TOLERANCE = 1e-3
+
+
+@pytest.fixture(scope='module')
+def fleet():
+    df = analysis.analyse(generate_battery_data(5000, seed=61))
+    return metrics.compute(df, ['Life Span Years', 'Health Status'])
+
+
+def max_relative_error(values, grid, estimate, bandwidth):
+    exact = density.exact_kde(values, grid, bandwidth)
+    return np.abs(estimate - exact).max() / exact.max()
+
+
+@pytest.mark.parametrize('column', ['State of Health (SOH) (%)', 'Capacity Fade (%)', 'Life Span Years',
+                                    'Internal Resistance (mΩ)', 'Cycle Count'])
+def test_kde_matches_exact_kde(fleet, column):
+    values = fleet[column].to_numpy(dtype=np.float64)
+    grid, estimate = density.kde(values)
+    assert max_relative_error(values, grid, estimate, density.scott_bandwidth(values)) < TOLERANCE
+
+
+def test_grouped_kde_matches_exact_kde_per_group(fleet):
+    values = fleet['State of Health (SOH) (%)'].to_numpy(dtype=np.float64)
+    codes = fleet['Health Status'].cat.codes.to_numpy()
+    n_groups = len(fleet['Health Status'].cat.categories)
+    grid, densities = density.grouped_kde(values, codes, n_groups)
+    for group in range(n_groups):
+        members = values[codes == group]
+        bandwidth = density.scott_bandwidth(members)
+        assert max_relative_error(members, grid, densities[group], bandwidth) < TOLERANCE
+        assert abs(densities[group].sum() * (grid[1] - grid[0]) - 1) < 1e-3
+
+
+def test_bimodal_mixture_matches_exact_kde():
+    rng = np.random.default_rng(62)
+    values = np.concatenate([rng.normal(0, 1, 3000), rng.normal(8, 0.3, 1000)])
+    grid, estimate = density.kde(values)
+    assert max_relative_error(values, grid, estimate, density.scott_bandwidth(values)) < TOLERANCE
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+import analysis
+import incremental
+import storage
+from DataSet import generate_battery_data
+
+
+def full_rerun(df, path):
+    storage.save_dataset(analysis.analyse(df), path)
+    return storage.load_dataset(path)
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.parquet'])
+def test_append_edit_delete_matches_full_rerun(tmp_path, suffix):
+    output = tmp_path / f"analysed{suffix}"
+    df = generate_battery_data(400, seed=51)
+    assert incremental.analyse_incremental(df, output) == {'recomputed': 400, 'reused': 0, 'dropped': 0}
+    assert incremental.analyse_incremental(df, output) == {'recomputed': 0, 'reused': 400, 'dropped': 0}
+
+    # Append 50 batteries, edit 10 readings and delete 30 batteries
+    edited = pd.concat([df, generate_battery_data(50, seed=52, start_id=401)], ignore_index=True)
+    edited.loc[[3, 77, 150, 151, 152, 200, 260, 300, 333, 399], 'Cycle Count'] += 100
+    edited = edited.drop(index=range(100, 130)).reset_index(drop=True)
+
+    report = incremental.analyse_incremental(edited, output)
+    assert report == {'recomputed': 60, 'reused': len(edited) - 60, 'dropped': 30}
+    pd.testing.assert_frame_equal(storage.load_dataset(output),
+                                  full_rerun(edited, tmp_path / f"full{suffix}"))
+
+
+def test_reordered_rows_are_reused(tmp_path):
+    output = tmp_path / 'analysed.csv'
+    df = generate_battery_data(200, seed=53)
+    incremental.analyse_incremental(df, output)
+    shuffled = df.sample(frac=1, random_state=0).reset_index(drop=True)
+    assert incremental.analyse_incremental(shuffled, output) == {'recomputed': 0, 'reused': 200, 'dropped': 0}
+    pd.testing.assert_frame_equal(storage.load_dataset(output), full_rerun(shuffled, tmp_path / 'full.csv'))
+
+
+def test_duplicate_batteries_are_rejected(tmp_path):
+    df = generate_battery_data(20, seed=54)
+    df.loc[5, 'Battery'] = df.loc[4, 'Battery']
+    with pytest.raises(ValueError, match='unique'):
+        incremental.analyse_incremental(df, tmp_path / 'analysed.csv')
@@ -0,0 +1,27 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import ingest
+from DataSet import generate_battery_data
+
+
+def test_serve_reads_stdin_redirected_from_a_file(tmp_path, monkeypatch):
+    path = tmp_path / 'readings.csv'
+    generate_battery_data(300, seed=5).to_csv(path, index=False)
+    with open(path) as stdin:
+        monkeypatch.setattr(sys, 'stdin', stdin)
+        stats = asyncio.run(ingest.serve(query_port=0, use_stdin=True, batch_size=64))
+    assert stats['received'] == 300
+    assert stats['scored'] == 300
+    assert stats['batteries'] == 300
+
+
+def test_serve_reads_stdin_from_a_pipe(tmp_path):
+    readings = generate_battery_data(50, seed=6).to_json(orient='records', lines=True)
+    done = subprocess.run([sys.executable, 'ingest.py', 'serve', '--stdin', '--query-port', '0'],
+                          input=readings, capture_output=True, text=True, timeout=60,
+                          cwd=os.path.dirname(os.path.abspath(ingest.__file__)))
+    assert done.returncode == 0, done.stderr
+    assert '"scored": 50' in done.stdout
@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+import pytest
+
+import analysis
+from DataSet import generate_battery_data
+
+# The vectorized metrics must give exactly what the row-wise calculate_*
+# functions in analysis.py give, on the shipped data and on the edge cases the
+# thresholds and clamps are sensitive to.
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'DataSets', 'ev_battery_health_data.csv')
+
+# Every edge of the temperature stress bands, and just either side of some
+TEMPERATURES = [-10, -0.1, 0, 4.9, 5, 9.9, 10, 14.9, 15, 19.9, 20, 25, 25.1, 30, 30.1,
+                35, 35.1, 40, 40.1, 45, 45.1, 60]
+# Voltage minus the voltage expected at the row's SOC; every stability threshold
+DEVIATIONS = [0, 0.049, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 1.0]
+# Around max_cycles = 2000, where the life span turns negative and wraps
+CYCLES = [0, 1, 1999, 2000, 2001, 2500, 3000, 4000, 10000]
+
+
+def edge_cases(seed=0):
+    rows = len(TEMPERATURES) + 2 * len(DEVIATIONS) + len(CYCLES) + 2
+    df = generate_battery_data(rows, seed=seed)
+    i = 0
+    for temp in TEMPERATURES:
+        df.loc[i, 'Temperature (°C)'] = temp
+        i += 1
+    for deviation in DEVIATIONS:
+        for sign in (1, -1):
+            expected = 3.2 + (df.loc[i, 'State of Charge (SOC) (%)'] / 100) * 1.0
+            df.loc[i, 'Voltage (V)'] = expected + sign * deviation
+            i += 1
+    for cycles in CYCLES:
+        df.loc[i, 'Cycle Count'] = cycles
+        i += 1
+    # Zero rated capacity, where capacity fade is undefined
+    df.loc[i, ['Initial Rated Capacity (Ah)', 'Full Charge Capacity (Ah)']] = [0.0, 0.0]
+    df.loc[i + 1, 'Initial Rated Capacity (Ah)'] = 0.0
+    return df
+
+
+def test_parity_on_shipped_dataset():
+    analysis.check_parity(pd.read_csv(DATASET))
+
+
+def test_parity_on_generated_fleet():
+    analysis.check_parity(generate_battery_data(5000, seed=42))
+
+
+def test_parity_on_edge_cases():
+    analysis.check_parity(edge_cases())
+
+
+def test_edge_cases_reach_every_band():
+    df = analysis.analyse(edge_cases())
+    assert set(df['Temperature Stress Factor']) == {0, 20, 40, 60, 80, 100}
+    assert set(df['Voltage Stability Rating']) == set(range(1, 11))
+    assert df['Capacity Fade (%)'].isna().sum() == 2
+    # Past max_cycles the remaining life is negative and wraps like the row-wise version
+    assert df.loc[df['Cycle Count'] > 2000, 'Life Span Remaining'].notna().all()
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_metrics_ignore_column_order(seed):
+    df = generate_battery_data(1000, seed=seed)
+    expected = analysis.analyse(df)
+    shuffled = analysis.analyse(df[df.columns[::-1]])
+    pd.testing.assert_frame_equal(shuffled[expected.columns], expected)
+
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+import metrics
+import query
+from DataSet import generate_battery_data
+
+FILTERS = [
+    [('Temperature Stress Factor', '>=', 60)],
+    [('Battery Health Score', '<', 70), ('Cycle Count', '>', 1500)],
+    [('Health Status', 'in', ['Poor', 'Critical']), ('Voltage (V)', '<=', 3.8)],
+    [('Charging/Discharging Rate', '==', 'Fast'), ('Voltage Stability Rating', '!=', 10)],
+]
+
+
+@pytest.fixture(scope='module')
+def fleet(tmp_path_factory):
+    df = analysis.analyse(generate_battery_data(3000, seed=11))
+    df = metrics.compute(df, query.BITMAP_COLUMNS)
+    return df, query.build_index(df, tmp_path_factory.mktemp('index'))
+
+
+def expected_rows(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        values = df[column]
+        mask &= values.isin(value) if op == 'in' else query._compare(op, values, value)
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_select_matches_pandas(fleet, filters):
+    df, index = fleet
+    rows = index.select_rows(filters)
+    np.testing.assert_array_equal(rows, expected_rows(df, filters))
+    result = index.fetch(rows, ['Battery', 'Battery Health Score'])
+    assert result['Battery'].tolist() == df['Battery'].iloc[rows].tolist()
+    assert result['Battery Health Score'].tolist() == df['Battery Health Score'].iloc[rows].tolist()
+
+
+@pytest.mark.parametrize('filters', [[]] + FILTERS)
+def test_top_matches_pandas(fleet, filters):
+    df, index = fleet
+    matching = df.iloc[expected_rows(df, filters)]
+    expected = matching.sort_values('Battery Health Score', kind='stable').head(25)
+    result = index.top(25, 'Battery Health Score', filters, columns=['Battery', 'Battery Health Score'])
+    assert result['Battery'].tolist() == expected['Battery'].tolist()
+
+
+def test_battery_labels_are_stored_as_ids(fleet, tmp_path):
+    df, index = fleet
+    with open(f"{index.directory}/data/columns.json", encoding='utf-8') as f:
+        assert 'categories' not in json.load(f)['Battery']
+    assert index.select([('Battery', '==', 'Battery 42')])['Battery'].tolist() == ['Battery 42']
+
+    # Labels of another form fall back to a categorical
+    other = df.head(50).assign(Battery=[f"EV-{i}" for i in range(50)])
+    other_index = query.build_index(other, tmp_path / 'other')
+    assert other_index.fetch(np.array([3, 7]), ['Battery'])['Battery'].tolist() == ['EV-3', 'EV-7']
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import analysis
+import storage
+from DataSet import generate_battery_data
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'analysed.csv'
+    storage.save_dataset(analysis.analyse(generate_battery_data(300, seed=71)), path)
+    return path
+
+
+def no_parsing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('the CSV was parsed instead of read from its sidecar')
+    monkeypatch.setattr(storage, 'read_csv', fail)
+
+
+def rewrite(path, df, mtime_ns):
+    storage.save_dataset(df, path)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_second_load_reads_the_sidecar(source, monkeypatch):
+    expected = storage.load_csv_cached(source)
+    assert os.path.exists(storage.cache_path(source))
+    no_parsing(monkeypatch)
+    pd.testing.assert_frame_equal(storage.load_csv_cached(source), expected)
+    columns = ['Battery', storage.LIFE_SPAN_DAYS, 'Battery Health Score']
+    pd.testing.assert_frame_equal(storage.load_csv_cached(source, columns), expected[columns])
+
+
+def test_size_change_rebuilds_the_sidecar(source):
+    storage.load_csv_cached(source)
+    bigger = analysis.analyse(generate_battery_data(310, seed=71))
+    rewrite(source, bigger, os.stat(source).st_mtime_ns)
+    assert len(storage.load_csv_cached(source)) == 310
+
+
+def test_same_size_edit_with_new_mtime_rebuilds_the_sidecar(source):
+    storage.load_csv_cached(source)
+    df = storage.load_dataset(source)
+    # Swap two rows: same size, different content
+    df = df.iloc[[1, 0] + list(range(2, len(df)))].reset_index(drop=True)
+    before = os.path.getsize(source)
+    rewrite(source, df, os.stat(source).st_mtime_ns + 10**9)
+    assert os.path.getsize(source) == before
+    assert storage.load_csv_cached(source)['Battery'].iloc[0] == df['Battery'].iloc[0]
+
+
+def test_touched_but_unchanged_source_keeps_its_sidecar(source, monkeypatch):
+    expected = storage.load_csv_cached(source)
+    mtime = os.stat(source).st_mtime_ns + 10**9
+    os.utime(source, ns=(mtime, mtime))
+    no_parsing(monkeypatch)
+    pd.testing.assert_frame_equal(storage.load_csv_cached(source), expected)
+    # The new mtime is recorded, so the next load does not hash the file again
+    monkeypatch.setattr(storage, 'file_hash', lambda path: pytest.fail('hashed again'))
+    pd.testing.assert_frame_equal(storage.load_csv_cached(source), expected)
+
+
+def test_without_pyarrow_the_csv_is_parsed(source, monkeypatch):
+    expected = storage.read_csv(source)
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    columns = ['Battery', storage.LIFE_SPAN_DAYS]
+    df = storage.load_csv_cached(source, columns)
+    assert not os.path.exists(storage.cache_path(source))
+    pd.testing.assert_frame_equal(df, expected[columns], check_dtype=False)
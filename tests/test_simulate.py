@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+import simulate
+from DataSet import generate_battery_data
+
+
+def test_results_do_not_depend_on_workers(monkeypatch):
+    df = generate_battery_data(120, seed=31)
+    # 40 batteries per block, so the fleet is split into three blocks
+    monkeypatch.setattr(simulate, 'CELLS_PER_BLOCK', 40 * 50)
+    one = simulate.simulate(df, scenarios=50, horizon_days=5 * 360, seed=4, workers=1)
+    two = simulate.simulate(df, scenarios=50, horizon_days=5 * 360, seed=4, workers=2)
+    pd.testing.assert_frame_equal(one[0], two[0])
+    pd.testing.assert_frame_equal(one[1], two[1])
+
+
+def test_fleet_counts_add_up_over_blocks(monkeypatch):
+    df = generate_battery_data(90, seed=32)
+    monkeypatch.setattr(simulate, 'CELLS_PER_BLOCK', 25 * 40)
+    per_battery, fleet = simulate.simulate(df, scenarios=40, horizon_days=5 * 360, seed=5, workers=1)
+    # Expected replacements within the horizon match the per-battery shares
+    np.testing.assert_allclose(fleet['Expected Replacements'].sum(),
+                               per_battery['Replaced Within Horizon (%)'].sum() / 100)
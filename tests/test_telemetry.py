@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+import telemetry
+from DataSet import generate_battery_data
+
+
+def _readings(rng, batteries, n):
+    return {'battery': rng.choice(batteries, n),
+            'timestamp': np.arange(n),
+            'soc': rng.uniform(0, 100, n),
+            'voltage': rng.uniform(3.1, 4.3, n),
+            'temperature': rng.uniform(10, 40, n),
+            'resistance': rng.uniform(20, 120, n),
+            'cycle_count': rng.integers(0, 3000, n)}
+
+
+def test_voltage_stability_includes_uncompacted_readings(tmp_path):
+    rng = np.random.default_rng(0)
+    store = telemetry.TelemetryStore(str(tmp_path / 'store'))
+    store.append(_readings(rng, np.arange(1, 40), 2000))
+    store.compact()
+    # Some batteries only appear in the log, some have a few readings there
+    store.append(_readings(rng, np.arange(30, 60), 300))
+    from_log = store.voltage_stability(window=20)
+
+    expected = pd.Series({b: telemetry.rolling_voltage_stability(store.history(b), 20)[-1]
+                          for b in range(1, 60)})
+    pd.testing.assert_series_equal(from_log, expected, check_names=False, check_dtype=False,
+                                   check_index_type=False)
+    store.compact()
+    pd.testing.assert_series_equal(from_log, store.voltage_stability(window=20))
+
+
+def test_apply_voltage_stability(tmp_path):
+    df = generate_battery_data(50, seed=1)
+    store = telemetry.TelemetryStore(str(tmp_path / 'store'))
+    for t in range(25):
+        store.append_frame(df.iloc[::2], t)
+    ratings = store.voltage_stability()
+
+    applied = telemetry.apply_voltage_stability(df, store)
+    ids = df['Battery'].map(telemetry.battery_id)
+    in_store = ids.isin(ratings.index)
+    assert in_store.sum() == 25
+    assert (applied.loc[in_store, 'Voltage Stability Rating'] == ids[in_store].map(ratings)).all()
+    assert applied['Voltage Stability Rating'].dtype == np.int64
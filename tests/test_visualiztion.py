@@ -0,0 +1,20 @@
+import os
+
+import visualiztion
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DataSets')
+
+
+def test_figures_without_their_columns_are_skipped(tmp_path, capsys):
+    source = os.path.join(DATASETS, 'ev_battery_health_data2.csv')
+    visualiztion.main(['--input', source, '--out-dir', str(tmp_path), '--workers', '1',
+                       '--figures', 'capacity_fade_distribution', 'soc_voltage_hexbin'])
+    out = capsys.readouterr().out
+    assert 'Skipping capacity_fade_distribution' in out
+    assert os.listdir(tmp_path) == ['soc_voltage_hexbin.png']
+
+
+def test_load_data_derives_only_supported_columns():
+    df = visualiztion.load_data(os.path.join(DATASETS, 'ev_battery_health_data2.csv'))
+    assert 'Capacity Fade (%)' not in df.columns
+    assert {'Battery Health Score', 'Life Span Years', 'Temp Range'} <= set(df.columns)